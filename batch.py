@@ -0,0 +1,259 @@
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from engine import PipelineEngine
+from pdf2jpeg import PDFToJPEG
+from conc_jsons import JSONConcatenator
+from page_pool import call_state
+from page_store import PageRef
+from result_cache import ResultCache
+from metrics import METRICS
+
+
+class BatchDocument:
+    """One PDF of a batch: its lazily rendered pages and the records of the pages finished so far."""
+
+    def __init__(self, pdf_file, output_docx):
+        self.pdf_file = pdf_file
+        self.output_docx = os.path.abspath(output_docx)
+        self.converter = PDFToJPEG()
+        self.document_key = None
+        self.pages = None
+        self.records = {}
+        self.keys = {}
+        self.failed_pages = []
+        self.submitted = 0
+        self.finished = 0
+        self.exhausted = False
+        self.failed = False
+
+    def is_done(self):
+        return self.exhausted and self.finished == self.submitted
+
+
+class BatchConverter:
+    """Convert many PDFs on one shared worker pool, scheduling their pages round-robin.
+
+    Up to max_open_documents documents render pages at once, and each scheduling
+    round takes one page from each of them in turn, so a long document cannot hold
+    the pool while short ones wait. A document's DOCX is written as soon as its
+    last page comes back, and the next document in line takes its place. A
+    document with pages that failed is still written, but counted as partial and
+    its DOCX is not cached; its good pages are.
+    """
+
+    def __init__(self, workers=None, ocr_mode="per_crop", cache=None, max_open_documents=None, max_in_flight=None,
+                 resolution="fixed", text_layer=True, page_store=True):
+        self.engine = PipelineEngine(workers=workers or os.cpu_count() or 1, max_in_flight=max_in_flight,
+                                     ocr_mode=ocr_mode, cache=cache, resolution=resolution, text_layer=text_layer,
+                                     page_store=page_store)
+        self.max_open_documents = max_open_documents or max(2, self.engine.workers)
+        self.pages_done = 0
+        self.documents_done = 0
+        self.documents_partial = 0
+        self.documents_failed = 0
+        # The PageStore that pages in flight are shared with the workers through, once one is rendered.
+        self.store = None
+
+    def open_document(self, pdf_file, output_docx):
+        """Start a document, or return None if it was served from the cache or could not be opened."""
+        document = BatchDocument(pdf_file, output_docx)
+        try:
+            os.makedirs(os.path.dirname(document.output_docx), exist_ok=True)
+            document.document_key, reused = self.engine.restore_document(pdf_file, document.output_docx)
+        except Exception as e:
+            print(f"Error opening {pdf_file}: {e}")
+            self.documents_failed += 1
+            return None
+        if reused:
+            self.documents_done += 1
+            return None
+        document.pages = self.engine.iter_pages_to_process(pdf_file, document.records, document.keys,
+                                                           converter=document.converter)
+        return document
+
+    def next_page(self, document):
+        """Return the document's next (page_number, page, source) to OCR, or None once it has no more."""
+        try:
+            item = next(document.pages, None)
+        except Exception as e:
+            print(f"Error rendering {document.pdf_file}: {e}")
+            document.failed = True
+            item = None
+        if item is None:
+            document.exhausted = True
+        return item
+
+    def finish_document(self, document):
+        if document.failed:
+            self.documents_failed += 1
+            return
+        concatenator = JSONConcatenator()
+        with self.engine.stage("concatenate"):
+            for page_number in sorted(document.records):
+                if document.records[page_number] is not None:
+                    concatenator.add_page(document.records[page_number])
+        failed_pages = sorted(document.failed_pages)
+        try:
+            self.engine.write_document(concatenator.concatenated(), document.output_docx, document.document_key,
+                                       partial=bool(failed_pages))
+        except Exception as e:
+            print(f"Error writing {document.output_docx}: {e}")
+            self.documents_failed += 1
+            return
+        if failed_pages:
+            self.documents_partial += 1
+            print(f"Partial {document.pdf_file}: pages {', '.join(map(str, failed_pages))} could not be converted "
+                  f"and are missing from {document.output_docx}")
+            return
+        self.documents_done += 1
+        print(f"Finished {document.pdf_file} ({len(document.records)} pages). "
+              f"{document.converter.orientation_summary()}")
+
+    def take_result(self, pool, future, document, page_number, page, source):
+        args = ("process_page_timed", page_number, page, None, source)
+        try:
+            records = self.engine.merge_timed_result(pool.result(future, call_state, args))
+        except Exception as e:
+            print(f"Error processing page {page_number} of {document.pdf_file}: {e}")
+            records = None
+        if isinstance(page, PageRef):
+            self.store.release(page)
+        document.records[page_number] = records
+        document.finished += 1
+        self.pages_done += 1
+        self.engine.record_page(page_number, records, document.keys, document.failed_pages)
+
+    def run(self, documents):
+        """Convert (pdf_file, output_docx) pairs and return the elapsed wall time in seconds."""
+        start = time.perf_counter()
+        waiting = deque(documents)
+        rendering = deque()
+        in_flight = {}
+
+        with self.engine.open_pool() as pool:
+            try:
+                self.schedule(pool, waiting, rendering, in_flight)
+            finally:
+                if self.store is not None:
+                    self.store.close(remove=True)
+                    self.store = None
+
+        return time.perf_counter() - start
+
+    def open_waiting(self, waiting, rendering):
+        """Open waiting documents until max_open_documents are rendering pages or none are left."""
+        while waiting and len(rendering) < self.max_open_documents:
+            document = self.open_document(*waiting.popleft())
+            if document is not None:
+                rendering.append(document)
+
+    def schedule(self, pool, waiting, rendering, in_flight):
+        """Keep the pool busy with pages of the open documents until every document is finished."""
+        while waiting or rendering or in_flight:
+            self.open_waiting(waiting, rendering)
+
+            # Top up the pool with one page per document in turn.
+            while rendering and len(in_flight) < pool.max_in_flight:
+                document = rendering.popleft()
+                item = self.next_page(document)
+                if item is None:
+                    if document.is_done():
+                        self.finish_document(document)
+                    # The next waiting document takes its place, and the remaining slots go to the open ones.
+                    self.open_waiting(waiting, rendering)
+                    continue
+                page_number, page, source = item
+                self.store, page = self.engine.share_page(self.store, page, pool.max_in_flight + 1)
+                future = pool.submit(call_state, "process_page_timed", page_number, page, None, source)
+                in_flight[future] = (document, page_number, page, source)
+                document.submitted += 1
+                rendering.append(document)
+
+            if not in_flight:
+                continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                document, page_number, page, source = in_flight.pop(future)
+                self.take_result(pool, future, document, page_number, page, source)
+                if document.is_done():
+                    self.finish_document(document)
+
+    def report(self, elapsed):
+        print(f"Converted {self.documents_done} documents ({self.pages_done} pages OCR'd) in {elapsed:.03f}s, "
+              f"{self.documents_partial} partial, {self.documents_failed} failed")
+        if elapsed > 0:
+            print(f"  {self.pages_done / elapsed:.2f} pages/s, {self.documents_done / elapsed:.2f} docs/s")
+        self.engine.report_timings()
+
+
+def read_documents(source, output_dir):
+    """List (pdf_file, output_docx) pairs from a directory of PDFs or a manifest file.
+
+    A manifest has one PDF per line, optionally followed by a tab and its output
+    path; blank lines and lines starting with # are ignored. Outputs without a
+    path go to output_dir, named after the PDF.
+    """
+    if os.path.isdir(source):
+        pdf_files = sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(".pdf"))
+        entries = [(pdf_file, None) for pdf_file in pdf_files]
+    else:
+        entries = []
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip() or line.startswith("#"):
+                    continue
+                pdf_file, _, output_docx = line.partition("\t")
+                entries.append((pdf_file.strip(), output_docx.strip() or None))
+
+    documents = []
+    for pdf_file, output_docx in entries:
+        if output_docx is None:
+            name = os.path.splitext(os.path.basename(pdf_file))[0] + ".docx"
+            output_docx = os.path.join(output_dir, name)
+        documents.append((pdf_file, output_docx))
+    return documents
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert a batch of PDFs to DOCX on one shared worker pool.")
+    parser.add_argument("source", help="A folder of PDFs, or a manifest listing one PDF (and optional output) per line.")
+    parser.add_argument("output_dir", help="Folder for DOCX files the manifest does not name.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of processes that detect and OCR pages (default: all cores).")
+    parser.add_argument("--ocr-mode", choices=("per_crop", "batched"), default="per_crop",
+                        help="Run Tesseract once per line crop, or once per page on stacked crops.")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Reuse page and document results cached in this folder across runs.")
+    parser.add_argument("--max-open-documents", type=int, default=None,
+                        help="How many documents share the pool at once (default: number of workers, at least 2).")
+    parser.add_argument("--resolution", choices=("fixed", "adaptive"), default="fixed",
+                        help="Render every page at 200 dpi, or find lines at 100 dpi and OCR at the dpi they need.")
+    parser.add_argument("--no-text-layer", action="store_true",
+                        help="OCR every page, even those with a text layer that could be read directly.")
+    parser.add_argument("--trace", default=None,
+                        help="Write a JSON trace of every stage, page and OCR call to this file.")
+
+    args = parser.parse_args()
+
+    documents = read_documents(args.source, args.output_dir)
+    if not documents:
+        print(f"No PDFs found in {args.source}")
+        sys.exit(1)
+
+    if args.trace:
+        METRICS.start_trace()
+    converter = BatchConverter(workers=args.workers, ocr_mode=args.ocr_mode,
+                               cache=ResultCache(args.cache_dir) if args.cache_dir else None,
+                               max_open_documents=args.max_open_documents, resolution=args.resolution,
+                               text_layer=not args.no_text_layer)
+    converter.report(converter.run(documents))
+    if args.trace:
+        METRICS.write_trace(args.trace)
+    if converter.documents_partial or converter.documents_failed:
+        sys.exit(1)
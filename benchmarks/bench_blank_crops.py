@@ -0,0 +1,172 @@
+"""Check with real Tesseract that skipping blank line crops keeps every line per-crop OCR keeps.
+
+Usage: python benchmarks/bench_blank_crops.py [pages] [seed] [font_size] [image_directory]
+
+Builds block records twice, through read_regions, which skips crops that are blank
+once binarized, and by OCR'ing every crop with read_region:
+
+- on edge-case crops: blank paper, a bare outline, a lone rule, specks, and crops
+  too thin to judge, each as outlined_region cuts it and without the outline;
+- on synthetic scanned pages, with a few extra boxes over empty margins;
+- on the page images in image_directory, if given, e.g. real scans.
+
+Reports Tesseract calls made and avoided, the time both took, and every crop or
+page whose records differ; exits with status 1 if one does.
+"""
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import make_page, MARGIN
+from new_raws import TextLineDetector, LINE_BOX_DTYPE
+from blocked import BlockExtractor
+from page_pool import page_number_key
+from metrics import METRICS
+
+# (x, y, w, h) of boxes over the empty margins of a synthetic page, the kind a speck of noise gets from Tesseract.
+MARGIN_BOXES = ((20, 20, 150, 40), (MARGIN // 4, 1200, 60, 30), (1500, 2250, 120, 50))
+
+
+def add_noise(page):
+    """Scanner noise of a few gray levels on gray paper, which Otsu still splits into "ink" and paper."""
+    page[:] = 225 + np.random.default_rng(0).integers(-6, 7, page.shape)
+
+
+def edge_case_pages():
+    """(name, page, box) for crops at the edge of what read_regions may skip, drawn on small paper pages."""
+    cases = []
+
+    def add(name, paper=255, draw=None, box=(10, 10, 200, 40)):
+        page = np.full((80, 240), paper, dtype=np.uint8)
+        if draw is not None:
+            draw(page)
+        cases.append((name, page, box))
+
+    add("white paper")
+    add("gray paper", paper=225)
+    add("noisy paper", draw=add_noise)
+    add("frame", draw=lambda page: cv2.rectangle(page, (14, 14), (206, 46), 0, 1))
+    add("rule", draw=lambda page: cv2.line(page, (20, 30), (200, 30), 0, 2))
+    add("specks", draw=lambda page: [cv2.circle(page, (x, 30), 1, 0, -1) for x in (40, 90, 150)])
+    add("dot leader", draw=lambda page: [cv2.circle(page, (x, 40), 2, 0, -1) for x in range(30, 200, 12)])
+    for size in (3, 4, 5):
+        add(f"{size}px tall", box=(10, 10, 200, size))
+        add(f"{size}px wide", box=(10, 10, size, 40))
+        add(f"{size}px tall rule", draw=lambda page, size=size: cv2.line(page, (10, 10 + size // 2),
+                                                                          (210, 10 + size // 2), 0, 1),
+            box=(10, 10, 200, size))
+    return cases
+
+
+def counter(name):
+    return sum(entry["value"] for entry in METRICS.summary()["counters"] if entry["name"] == name)
+
+
+def per_crop_records(extractor, gray, boxes):
+    """What extract_blocks_from_boxes returns when every crop goes to Tesseract."""
+    image_height, image_width = gray.shape
+    rectangles = extractor.rectangles_from_boxes(boxes, image_width, image_height)
+    regions = []
+    colors = []
+    for x, y, w, h, _ in rectangles:
+        region, avg_color = extractor.outlined_region(gray, x, y, w, h)
+        regions.append(region)
+        colors.append(avg_color)
+    texts = [extractor.read_region(region) for region in regions]
+    return extractor.build_records(rectangles, texts, colors, image_width, image_height)
+
+
+def timed(func, *args):
+    METRICS.reset()
+    start = time.perf_counter()
+    records = func(*args)
+    return records, time.perf_counter() - start, counter("tesseract_calls_total"), counter("ocr_regions_skipped_total")
+
+
+class Comparison:
+    """Tesseract calls, time and differences of the skipping and per-crop paths, summed over pages and crops."""
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+        self.totals = {"per crop": [0.0, 0], "skipping": [0.0, 0]}
+        self.skipped = 0
+        self.compared = 0
+        self.differing = []
+
+    def page(self, name, gray, boxes):
+        reference, seconds, calls, _ = timed(per_crop_records, self.extractor, gray, boxes)
+        self.totals["per crop"][0] += seconds
+        self.totals["per crop"][1] += calls
+        records, seconds, calls, skipped = timed(self.extractor.extract_blocks_from_boxes, gray, boxes)
+        self.totals["skipping"][0] += seconds
+        self.totals["skipping"][1] += calls
+        self.skipped += skipped
+        self.compared += 1
+        if records != reference:
+            self.differing.append(name)
+
+    def crop(self, name, gray):
+        """A crop without the outline outlined_region draws, e.g. one the legacy path cut from a page."""
+        METRICS.reset()
+        reference = self.extractor.read_region(gray)
+        METRICS.reset()
+        text = self.extractor.read_regions([gray])[0]
+        self.skipped += counter("ocr_regions_skipped_total")
+        kept = [len(t) >= 2 and self.extractor.checker_words(t) > 0 for t in (reference, text)]
+        self.compared += 1
+        if kept[0] != kept[1] or (kept[0] and reference != text):
+            self.differing.append(name)
+
+    def report(self):
+        for name, (seconds, calls) in self.totals.items():
+            print(f"{name:<9} {seconds:8.3f}s  {calls:6d} Tesseract calls")
+        print(f"Blank crops skipped: {self.skipped}, "
+              f"calls avoided on pages: {self.totals['per crop'][1] - self.totals['skipping'][1]}")
+        if self.differing:
+            print(f"Records differ on: {', '.join(self.differing)}")
+            return False
+        print(f"Records identical on all {self.compared} pages and crops")
+        return True
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    font_size = int(sys.argv[3]) if len(sys.argv) > 3 else 28
+    image_directory = sys.argv[4] if len(sys.argv) > 4 else None
+
+    detector = TextLineDetector()
+    comparison = Comparison(BlockExtractor())
+
+    for name, page, (x, y, w, h) in edge_case_pages():
+        comparison.page(f"{name} (outlined)", page, np.array([(x, y, w, h, -1)], dtype=LINE_BOX_DTYPE))
+        comparison.crop(f"{name} (bare)", page[y:y + h, x:x + w].copy())
+
+    margin_boxes = np.array([(*box, -1) for box in MARGIN_BOXES], dtype=LINE_BOX_DTYPE)
+    for number in range(pages):
+        gray = np.asarray(make_page(seed * 100003 + number, font_size=font_size).image)
+        comparison.page(f"synthetic page {number + 1}", gray, np.concatenate([detector.detect_lines(gray), margin_boxes]))
+
+    if image_directory:
+        filenames = sorted(
+            (f for f in os.listdir(image_directory) if f.lower().endswith(('.png', '.jpg', '.jpeg'))),
+            key=page_number_key
+        )
+        for filename in filenames:
+            gray = cv2.imread(os.path.join(image_directory, filename), cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                print(f"Skipping unreadable image {filename}")
+                continue
+            comparison.page(filename, gray, detector.detect_lines(gray))
+
+    if not comparison.report():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
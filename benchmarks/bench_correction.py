@@ -0,0 +1,84 @@
+"""Check the compiled correction rules against sequential str.replace/re.sub and time both.
+
+Usage: python benchmarks/bench_correction.py [rules_file] [lines]
+
+Fuzzes random lines built from rule fragments, so chained and overlapping
+replacements are exercised, and fails if any line differs from the reference.
+"""
+import os
+import re
+import json
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_rules import DEFAULT_RULES, CorrectionRules
+
+WORDS = "статья закон федерации российской бюджетных субсидий пункт часть изменения вносятся следующие 12 5".split()
+FILLER = ["Статья ", "закон ", "1", "5", "12", " ", "  ", "А", "Б", ")", "?", "'", "!", "°", ";", "\"", ".", "I"]
+
+
+def reference_correction(rules, text):
+    """Apply the rules one at a time, the way text_correction used to."""
+    for rule in rules["replacements"]:
+        text = text.replace(rule["old"], rule["new"])
+    for rule in rules["patterns"]:
+        if rule.get("lower"):
+            text = re.sub(rule["pattern"], lambda match: match.expand(rule["replace"]).lower(), text)
+        else:
+            text = re.sub(rule["pattern"], rule["replace"], text)
+    return text
+
+
+def fuzz_lines(rules, count, seed=0):
+    rng = random.Random(seed)
+    fragments = FILLER[:]
+    for rule in rules["replacements"]:
+        fragments += [rule["old"], rule["new"], rule["old"][:len(rule["old"]) // 2], rule["old"][len(rule["old"]) // 2:]]
+    return ["".join(rng.choice(fragments) for _ in range(rng.randint(1, 12))) for _ in range(count)]
+
+
+def plain_lines(count, seed=0):
+    """Lines of ordinary words, like most of what OCR returns, which few rules touch."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) for _ in range(count)]
+
+
+def time_it(func, lines, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            func(line)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    rules_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_RULES
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    compiled = CorrectionRules.from_file(rules_path)
+    with open(rules_path, "r", encoding="utf-8") as f:
+        rules = json.load(f)
+
+    lines = fuzz_lines(rules, count)
+    mismatches = [line for line in lines if compiled.apply(line) != reference_correction(rules, line)]
+    print(f"Rules {compiled.key}: {len(compiled.replacements)} replacements in {len(compiled.stages)} passes, "
+          f"{len(compiled.patterns)} patterns")
+    if mismatches:
+        print(f"{len(mismatches)} of {count} lines differ from the reference, e.g. {mismatches[0]!r}")
+        sys.exit(1)
+    print(f"All {count} fuzzed lines match the reference")
+
+    for label, corpus in (("fuzzed", lines), ("plain", plain_lines(count))):
+        reference_seconds = time_it(lambda line: reference_correction(rules, line), corpus)
+        compiled_seconds = time_it(compiled.apply, corpus)
+        print(f"{label} lines:")
+        print(f"  reference {reference_seconds / count * 1e6:.2f} us/line")
+        print(f"  compiled  {compiled_seconds / count * 1e6:.2f} us/line")
+        print(f"  speedup   {reference_seconds / compiled_seconds:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Time the streaming DOCX writer against the python-docx Document path and check their bodies match.
+
+Usage: python benchmarks/bench_docx_writer.py [paragraphs]
+"""
+import os
+import sys
+import time
+import random
+import zipfile
+import tempfile
+import resource
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_docx import JSONToDocxConverter
+
+WORDS = "статья закон федерации российской бюджетных субсидий пункт часть изменения вносятся следующие".split()
+
+
+def synthetic_paragraphs(count, seed=0):
+    rng = random.Random(seed)
+    return [{
+        "order": order,
+        "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 60))),
+        "paragraph": rng.choice(["cs", "ls", "ls", "ls", "rs", "lc"]),
+        "font_type": "bold" if rng.random() < 0.1 else "normal",
+    } for order in range(1, count + 1)]
+
+
+def measure(output_dir, streaming, count, filename):
+    """Write the document in this (fresh) process and return (seconds, peak RSS in bytes)."""
+    paragraphs = synthetic_paragraphs(count)
+    converter = JSONToDocxConverter(output_dir=output_dir, streaming=streaming)
+    start = time.perf_counter()
+    converter.write_docx(iter(paragraphs), filename)
+    seconds = time.perf_counter() - start
+    return seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def body(path):
+    xml = zipfile.ZipFile(path).read("word/document.xml").decode("utf-8")
+    return xml[xml.index("<w:body>"):]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    output_dir = tempfile.mkdtemp()
+
+    results = {}
+    for label, streaming in (("python-docx", False), ("streaming", True)):
+        # A process per writer, so each peak RSS only reflects its own run.
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results[label] = executor.submit(measure, output_dir, streaming, count, f"{label}.docx").result()
+
+    same = body(os.path.join(output_dir, "python-docx.docx")) == body(os.path.join(output_dir, "streaming.docx"))
+    print(f"{count} paragraphs, document bodies {'identical' if same else 'DIFFER'}")
+    for label, (seconds, peak) in results.items():
+        print(f"  {label:<12} {seconds:.2f}s  peak RSS {peak / 2 ** 20:.0f} MiB")
+    print(f"  speedup      {results['python-docx'][0] / results['streaming'][0]:.1f}x")
+    if not same:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
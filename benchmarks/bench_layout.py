@@ -0,0 +1,71 @@
+"""Compare the vectorized paragraph classifier with the original chained checks on a large document.
+
+Usage: python benchmarks/bench_layout.py [lines]
+"""
+import os
+import sys
+import copy
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_docx import JSONToDocxConverter
+
+
+def synthetic_records(count, seed=0):
+    """Block records shaped like a concatenated legal text: two indents, centred headings and gaps."""
+    rng = random.Random(seed)
+    records = []
+    for order in range(1, count + 1):
+        kind = rng.random()
+        if kind < 0.6:
+            left, right = rng.randint(110, 125), rng.randint(100, 140)
+        elif kind < 0.85:
+            left, right = rng.randint(170, 185), rng.randint(100, 140)
+        elif kind < 0.95:
+            left = rng.randint(300, 600)
+            right = left + rng.randint(-8, 8)
+        else:
+            left, right = rng.randint(900, 1200), rng.randint(40, 80)
+        vertical = rng.randint(8, 20) if rng.random() < 0.8 else rng.randint(40, 120)
+        records.append({
+            "order": order,
+            "text": "строка",
+            "horizontal_length_left": left,
+            "horizontal_length_right": right,
+            "vertical_length_to_previous": vertical,
+            "color_code": [230, 230, 230],
+        })
+    return records
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    converter = JSONToDocxConverter(output_dir=tempfile.mkdtemp())
+    records = synthetic_records(count)
+
+    slow_data = copy.deepcopy(records)
+    fast_data = copy.deepcopy(records)
+    start = time.perf_counter()
+    converter.classify_paragraphs_slow(slow_data)
+    slow_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    labels = converter.classify_paragraphs(fast_data)
+    fast_seconds = time.perf_counter() - start
+
+    expected = [entry["paragraph"] for entry in slow_data[1:]]
+    if labels != expected:
+        mismatches = sum(a != b for a, b in zip(labels or [], expected))
+        print(f"Labels differ from the original classification ({mismatches} of {len(expected)})")
+        sys.exit(1)
+    print(f"{count} lines, labels identical")
+    print(f"  original   {slow_seconds:.3f}s")
+    print(f"  vectorized {fast_seconds:.3f}s")
+    print(f"  speedup    {slow_seconds / fast_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
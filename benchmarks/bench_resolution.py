@@ -0,0 +1,59 @@
+"""Compare the fixed 200 dpi and adaptive resolution modes on a synthetic scanned PDF.
+
+Usage: python benchmarks/bench_resolution.py [pages] [seed] [font_size]
+
+For each mode, reports wall time, rendered megapixels, the OCR dpi chosen per
+page, and text accuracy as the similarity of the DOCX text to the text the
+synthetic pages were drawn with.
+"""
+import os
+import sys
+import time
+import tempfile
+from difflib import SequenceMatcher
+
+import docx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_pdf
+from engine import PipelineEngine
+from metrics import METRICS
+
+
+def counter(name):
+    return {tuple(sorted(entry["labels"].items())): entry["value"]
+            for entry in METRICS.summary()["counters"] if entry["name"] == name}
+
+
+def run_mode(pdf_file, output_docx, resolution):
+    METRICS.reset()
+    engine = PipelineEngine(resolution=resolution)
+    start = time.perf_counter()
+    engine.run(pdf_file, output_docx)
+    seconds = time.perf_counter() - start
+    text = " ".join(paragraph.text for paragraph in docx.Document(output_docx).paragraphs)
+    return seconds, sum(counter("pixels_rendered_total").values()), counter("ocr_dpi_pages_total"), text
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    font_size = int(sys.argv[3]) if len(sys.argv) > 3 else 28
+
+    output_dir = tempfile.mkdtemp(prefix="bench_resolution_")
+    pdf_file = os.path.join(output_dir, "synthetic.pdf")
+    layouts = write_pdf(pdf_file, pages, seed, font_size=font_size)
+    truth = " ".join(text for lines in layouts for _, text in lines)
+
+    print(f"{pages} synthetic pages, {font_size}px font at 200 dpi")
+    for resolution in ("fixed", "adaptive"):
+        seconds, pixels, dpis, text = run_mode(pdf_file, os.path.join(output_dir, f"{resolution}.docx"), resolution)
+        accuracy = SequenceMatcher(None, truth, text, autojunk=False).ratio()
+        chosen = ", ".join(f"{dict(labels)['dpi']} dpi: {count}" for labels, count in sorted(dpis.items())) or "200 dpi"
+        print(f"  {resolution:<9} {seconds:8.2f}s  {pixels / 1e6:8.1f} MP rendered  "
+              f"accuracy {accuracy:.3f}  ({chosen})")
+
+
+if __name__ == "__main__":
+    main()
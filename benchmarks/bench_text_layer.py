@@ -0,0 +1,50 @@
+"""Compare reading a born-digital PDF's text layer with OCR'ing its pages.
+
+Usage: python benchmarks/bench_text_layer.py [pages] [seed]
+
+Converts the same synthetic typeset PDF with and without the text-layer fast path
+and reports pages/s, the speedup, and how closely each DOCX matches the text the
+pages were typeset with. Needs PyMuPDF.
+"""
+import os
+import sys
+import time
+import tempfile
+from difflib import SequenceMatcher
+
+import docx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_typeset_pdf
+from engine import PipelineEngine
+
+
+def convert(pdf_file, output_docx, text_layer):
+    engine = PipelineEngine(text_layer=text_layer)
+    start = time.perf_counter()
+    engine.run(pdf_file, output_docx)
+    seconds = time.perf_counter() - start
+    return seconds, " ".join(paragraph.text for paragraph in docx.Document(output_docx).paragraphs)
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    output_dir = tempfile.mkdtemp(prefix="bench_text_layer_")
+    pdf_file = os.path.join(output_dir, "typeset.pdf")
+    layouts = write_typeset_pdf(pdf_file, pages, seed)
+    truth = " ".join(text for lines in layouts for _, text in lines)
+
+    results = {}
+    for name, text_layer in (("ocr", False), ("text_layer", True)):
+        seconds, text = convert(pdf_file, os.path.join(output_dir, f"{name}.docx"), text_layer)
+        results[name] = seconds
+        accuracy = SequenceMatcher(None, truth, text, autojunk=False).ratio()
+        print(f"{name:<11} {seconds:8.3f}s  {pages / seconds:8.2f} pages/s  accuracy {accuracy:.3f}")
+    print(f"Text layer speedup: {results['ocr'] / results['text_layer']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
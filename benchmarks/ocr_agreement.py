@@ -0,0 +1,80 @@
+"""Measure how closely batched OCR matches the per-crop path on a folder of page images.
+
+Usage: python benchmarks/ocr_agreement.py <image_directory> [tesseract_lang]
+"""
+import os
+import sys
+import time
+from difflib import SequenceMatcher
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_raws import TextLineDetector
+from blocked import BlockExtractor
+from page_pool import page_number_key
+
+
+def compare_page(gray, detector, per_crop, batched):
+    """Return (per-line similarities, per-crop seconds, batched seconds) for one grayscale page."""
+    boxes = detector.detect_lines(gray)
+    image_height, image_width = gray.shape
+    rectangles = per_crop.rectangles_from_boxes(boxes, image_width, image_height)
+    regions = [per_crop.outlined_region(gray, x, y, w, h)[0] for x, y, w, h, _ in rectangles]
+
+    start = time.perf_counter()
+    reference = per_crop.read_regions(regions)
+    per_crop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    candidate = batched.read_regions(regions)
+    batched_seconds = time.perf_counter() - start
+
+    similarities = [SequenceMatcher(None, a, b).ratio() for a, b in zip(reference, candidate)]
+    return similarities, per_crop_seconds, batched_seconds
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python benchmarks/ocr_agreement.py <image_directory> [tesseract_lang]")
+        sys.exit(1)
+
+    image_directory = sys.argv[1]
+    lang = sys.argv[2] if len(sys.argv) == 3 else "rus"
+    detector = TextLineDetector()
+    per_crop = BlockExtractor(tesseract_lang=lang, ocr_mode="per_crop")
+    batched = BlockExtractor(tesseract_lang=lang, ocr_mode="batched")
+
+    similarities = []
+    per_crop_total = batched_total = 0.0
+    filenames = sorted(
+        (f for f in os.listdir(image_directory) if f.lower().endswith(('.png', '.jpg', '.jpeg'))),
+        key=page_number_key
+    )
+    for filename in filenames:
+        gray = cv2.imread(os.path.join(image_directory, filename), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"Skipping unreadable image {filename}")
+            continue
+        page_similarities, per_crop_seconds, batched_seconds = compare_page(gray, detector, per_crop, batched)
+        similarities.extend(page_similarities)
+        per_crop_total += per_crop_seconds
+        batched_total += batched_seconds
+        mean = sum(page_similarities) / len(page_similarities) if page_similarities else 1.0
+        print(f"{filename}: {len(page_similarities)} lines, similarity {mean:.4f}, "
+              f"per-crop {per_crop_seconds:.03f}s, batched {batched_seconds:.03f}s")
+
+    if not similarities:
+        print("No lines found.")
+        return
+
+    exact = sum(1 for s in similarities if s == 1.0) / len(similarities)
+    print(f"Lines: {len(similarities)}")
+    print(f"Mean character similarity: {sum(similarities) / len(similarities):.4f}")
+    print(f"Identical lines: {exact:.2%}")
+    print(f"Per-crop OCR: {per_crop_total:.03f}s, batched OCR: {batched_total:.03f}s")
+
+
+if __name__ == "__main__":
+    main()
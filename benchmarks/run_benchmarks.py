@@ -0,0 +1,236 @@
+"""Benchmark each pipeline stage and the end-to-end run on synthetic scanned PDFs of several sizes.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 1,5,20] [--workers N] [--output results.json]
+                                           [--baseline baseline.json | --record-baseline]
+                                           [--tolerance 0.15] [--min-ms 1]
+
+Reports pages/s, per-stage latency percentiles (per page, or per document for the
+DOCX writer) and peak RSS, and compares every metric against a baseline: by
+default benchmarks/baseline.json. The script exits with status 1 if any metric
+regressed by more than the tolerance.
+
+Timings only compare on the same machine and Tesseract build, so no baseline is
+shipped: record one first with --record-baseline (e.g. on the CI runner, from the
+commit to compare against). Without a baseline the script exits with status 2.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import write_pdf
+from pdf2jpeg import PDFToJPEG
+from new_raws import TextLineDetector
+from blocked import BlockExtractor
+from conc_jsons import JSONConcatenator
+from write_docx import JSONToDocxConverter
+from engine import PipelineEngine
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+STAGES = ("PDFToJPEG", "TextLineDetector", "BlockExtractor", "JSONConcatenator", "JSONToDocxConverter")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def summarize(samples):
+    """Count, total and latency percentiles in milliseconds for a list of durations in seconds."""
+    values = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "total_ms": float(values.sum()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+    }
+
+
+def timed(samples, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def bench_stages(pdf_file, output_dir):
+    """Run the stage classes one after another on every page, timing each call. Runs in a fresh process."""
+    samples = {name: [] for name in STAGES}
+    converter = PDFToJPEG()
+    detector = TextLineDetector()
+    extractor = BlockExtractor()
+    concatenator = JSONConcatenator()
+
+    converter.reset_orientation()
+    rendered = converter.iter_rendered_pages(pdf_file, in_memory=True)
+    while True:
+        start = time.perf_counter()
+        image = next(rendered, None)
+        if image is None:
+            break
+        page = np.asarray(converter.process_page(image))
+        samples["PDFToJPEG"].append(time.perf_counter() - start)
+
+        boxes = timed(samples["TextLineDetector"], detector.detect_lines, page)
+        records = timed(samples["BlockExtractor"], extractor.extract_blocks_from_boxes, page, boxes)
+        timed(samples["JSONConcatenator"], concatenator.add_page, records)
+
+    writer = JSONToDocxConverter(output_dir=output_dir)
+    timed(samples["JSONToDocxConverter"], writer.convert_data, concatenator.concatenated(), "stages.docx")
+    return {"stages": {name: summarize(values) for name, values in samples.items() if values},
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_end_to_end(pdf_file, output_dir, pages, workers):
+    """Convert the PDF with PipelineEngine and measure throughput. Runs in a fresh process."""
+    engine = PipelineEngine(workers=workers)
+    start = time.perf_counter()
+    engine.run(pdf_file, os.path.join(output_dir, "end_to_end.docx"))
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "pages_per_second": pages / seconds, "peak_rss_mb": peak_rss_mb()}
+
+
+def in_fresh_process(func, *args):
+    """Run func in its own process, so peak RSS covers only that run."""
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(func, *args).result()
+
+
+def corpus_pdf(corpus_dir, pages, seed):
+    """Path of the synthetic PDF for this size and seed, generated on first use."""
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, f"synthetic_{pages}p_seed{seed}.pdf")
+    if not os.path.exists(path):
+        write_pdf(path, pages, seed, sideways_every=10)
+    return path
+
+
+def environment():
+    try:
+        import pytesseract
+        tesseract = str(pytesseract.get_tesseract_version())
+    except Exception:
+        tesseract = None
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "tesseract": tesseract}
+
+
+def run_suite(sizes, workers, corpus_dir, seed):
+    results = {"environment": environment(), "workers": workers, "seed": seed, "sizes": {}}
+    for pages in sizes:
+        pdf_file = corpus_pdf(corpus_dir, pages, seed)
+        output_dir = tempfile.mkdtemp(prefix="bench_")
+        print(f"Benchmarking {pages} pages ({pdf_file})")
+        stages = in_fresh_process(bench_stages, pdf_file, output_dir)
+        end_to_end = in_fresh_process(bench_end_to_end, pdf_file, output_dir, pages, workers)
+        results["sizes"][str(pages)] = {"pages": pages, **stages, "end_to_end": end_to_end}
+    return results
+
+
+def print_results(results):
+    for size, result in results["sizes"].items():
+        end_to_end = result["end_to_end"]
+        print(f"{size} pages: {end_to_end['pages_per_second']:.2f} pages/s end to end, "
+              f"peak RSS {end_to_end['peak_rss_mb']:.0f} MiB (stages {result['peak_rss_mb']:.0f} MiB)")
+        for name, stats in result["stages"].items():
+            print(f"  {name:<20} p50 {stats['p50_ms']:9.1f} ms  p90 {stats['p90_ms']:9.1f} ms  "
+                  f"p99 {stats['p99_ms']:9.1f} ms  (n={stats['count']})")
+
+
+def compare(results, baseline, tolerance, min_ms=1.0):
+    """Print every metric against the baseline and return the list of regressions.
+
+    Latencies under min_ms in both runs are skipped; at that scale the noise exceeds any tolerance.
+    """
+    regressions = []
+
+    def check(label, current, previous, higher_is_better=False, floor=0.0):
+        if previous is None or current is None or previous <= 0 or max(current, previous) < floor:
+            return
+        change = current / previous - 1
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"  {label:<45} {previous:10.2f} -> {current:10.2f} ({change:+.1%}) {flag}")
+        if flag:
+            regressions.append(label)
+
+    print(f"Compared with baseline (tolerance {tolerance:.0%}):")
+    if baseline.get("environment") != results["environment"]:
+        print(f"  Warning: the baseline was recorded on {baseline.get('environment')}")
+    for size, result in results["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if previous is None:
+            print(f"  {size} pages: not in baseline")
+            continue
+        check(f"{size}p end_to_end pages/s", result["end_to_end"]["pages_per_second"],
+              previous["end_to_end"]["pages_per_second"], higher_is_better=True)
+        check(f"{size}p end_to_end peak RSS MiB", result["end_to_end"]["peak_rss_mb"],
+              previous["end_to_end"]["peak_rss_mb"])
+        for name, stats in result["stages"].items():
+            old = previous["stages"].get(name)
+            if old is not None:
+                check(f"{size}p {name} p50 ms", stats["p50_ms"], old["p50_ms"], floor=min_ms)
+                check(f"{size}p {name} p90 ms", stats["p90_ms"], old["p90_ms"], floor=min_ms)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the conversion pipeline on synthetic scanned PDFs.")
+    parser.add_argument("--sizes", default="1,5,20", help="Comma-separated document sizes in pages.")
+    parser.add_argument("--workers", type=int, default=1, help="Workers for the end-to-end run.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpus.")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "pdf-to-docx-bench-corpus"),
+                        help="Where generated PDFs are kept between runs.")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Compare with a results JSON file from an earlier run (default: benchmarks/baseline.json).")
+    parser.add_argument("--record-baseline", action="store_true",
+                        help="Save the results as the new baseline instead of comparing with it.")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Relative slowdown or growth that counts as a regression.")
+    parser.add_argument("--min-ms", type=float, default=1.0,
+                        help="Ignore stage latencies below this many milliseconds when comparing.")
+    args = parser.parse_args()
+    if not args.record_baseline and not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, so regressions cannot be detected. "
+              f"Record one on this machine with --record-baseline first.")
+        sys.exit(2)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = run_suite(sizes, args.workers, args.corpus_dir, args.seed)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+
+    if args.record_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.min_ms)
+    if regressions:
+        print(f"{len(regressions)} metrics regressed")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Deterministic synthetic scanned pages and PDFs for benchmarking, generated offline.
+
+Each page is a Russian legal text with a known layout: a centred bold heading,
+paragraphs with a first-line indent and a right-aligned signature line.
+It is rendered at 200 dpi, skewed slightly, sometimes turned sideways, and given
+scanner noise. The same seed always gives the same page.
+
+write_typeset_pdf makes the born-digital counterpart, with a real text layer
+and no scanned images; it needs PyMuPDF.
+
+Usage: python benchmarks/synthetic.py <output_pdf> [pages] [seed]
+"""
+import os
+import sys
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_SIZE = (1654, 2339)  # A4 at 200 dpi
+MARGIN = 200
+INDENT = 70
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf",
+    "/usr/share/fonts/truetype/DejaVuSerif.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSerif.ttf",
+    "/Library/Fonts/DejaVuSerif.ttf",
+    "C:\\Windows\\Fonts\\times.ttf",
+)
+WORDS = ("Российской Федерации вносятся следующие изменения статья закон пункт часть бюджетных субсидий "
+         "от года порядок предоставления средств федерального бюджета утвердить настоящего постановления "
+         "правительства органов власти субъектов").split()
+HEADINGS = ("ПОСТАНОВЛЕНИЕ", "О ВНЕСЕНИИ ИЗМЕНЕНИЙ", "ПРАВИЛА ПРЕДОСТАВЛЕНИЯ СУБСИДИЙ")
+
+
+def find_font(bold=False):
+    """Path of a TrueType font with Cyrillic glyphs; set BENCH_FONT to override."""
+    candidates = [os.environ.get("BENCH_FONT")] if os.environ.get("BENCH_FONT") else []
+    for path in FONT_CANDIDATES:
+        candidates.append(path.replace("Serif.ttf", "Serif-Bold.ttf") if bold else path)
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    raise FileNotFoundError("No Cyrillic TrueType font found; set BENCH_FONT to a .ttf file such as DejaVuSerif.")
+
+
+class SyntheticPage:
+    """One generated page: the grayscale image plus the layout it was drawn with."""
+
+    def __init__(self, image, lines, angle):
+        self.image = image
+        # (kind, text) for every drawn line: heading, indent, body or signature.
+        self.lines = lines
+        self.angle = angle
+
+
+def wrap_words(rng, draw, font, width):
+    line = ""
+    while True:
+        word = rng.choice(WORDS)
+        candidate = f"{line} {word}".strip()
+        if draw.textlength(candidate, font=font) > width:
+            return line
+        line = candidate
+
+
+def make_page(seed, font_size=28, noise=6.0, max_skew=0.6, sideways=False):
+    """Render the page for seed, skewed by up to max_skew degrees and optionally turned 90 degrees."""
+    rng = random.Random(seed)
+    width, height = PAGE_SIZE
+    font = ImageFont.truetype(find_font(), font_size)
+    bold = ImageFont.truetype(find_font(bold=True), font_size)
+    image = Image.new("L", PAGE_SIZE, 255)
+    draw = ImageDraw.Draw(image)
+    line_height = int(font_size * 1.6)
+    lines = []
+
+    y = MARGIN
+    heading = rng.choice(HEADINGS)
+    draw.text(((width - draw.textlength(heading, font=bold)) / 2, y), heading, font=bold, fill=0)
+    lines.append(("heading", heading))
+    y += 2 * line_height
+
+    while y < height - MARGIN - 3 * line_height:
+        for index in range(rng.randint(2, 6)):
+            if y >= height - MARGIN - 3 * line_height:
+                break
+            x = MARGIN + (INDENT if index == 0 else 0)
+            text = wrap_words(rng, draw, font, width - MARGIN - x)
+            draw.text((x, y), text, font=font, fill=0)
+            lines.append(("indent" if index == 0 else "body", text))
+            y += line_height
+        y += line_height // 2
+
+    signature = "Председатель Правительства"
+    draw.text((width - MARGIN - draw.textlength(signature, font=font), y + line_height), signature, font=font, fill=0)
+    lines.append(("signature", signature))
+
+    angle = rng.uniform(-max_skew, max_skew)
+    if sideways:
+        angle += 90
+    image = image.rotate(angle, resample=Image.BILINEAR, expand=sideways, fillcolor=255)
+
+    if noise:
+        pixels = np.asarray(image, dtype=np.float32)
+        generator = np.random.default_rng(seed)
+        pixels += generator.normal(0, noise, pixels.shape)
+        specks = generator.random(pixels.shape) < 0.0005
+        pixels[specks] = 0
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return SyntheticPage(image, lines, angle)
+
+
+def write_pdf(path, pages, seed=0, sideways_every=0, **page_options):
+    """Write a scanned-looking PDF of the given number of pages and return the list of page layouts.
+
+    With sideways_every=n, every n-th page is turned 90 degrees to exercise orientation detection.
+    """
+    generated = [
+        make_page(seed * 100003 + number, sideways=bool(sideways_every) and (number + 1) % sideways_every == 0,
+                  **page_options)
+        for number in range(pages)
+    ]
+    images = [page.image for page in generated]
+    images[0].save(path, "PDF", resolution=200, save_all=True, append_images=images[1:])
+    return [page.lines for page in generated]
+
+
+def write_typeset_pdf(path, pages, seed=0, font_size=12):
+    """Write a born-digital PDF with the same kind of layout as make_page, and return the drawn lines per page."""
+    import pymupdf
+
+    width, height = 595, 842  # A4 in points
+    margin, indent, line_height = 72, 25, font_size * 1.5
+    regular = pymupdf.Font(fontfile=find_font())
+    document = pymupdf.open()
+    layouts = []
+    for number in range(pages):
+        rng = random.Random(seed * 100003 + number)
+        page = document.new_page(width=width, height=height)
+        page.insert_font(fontname="R", fontfile=find_font())
+        page.insert_font(fontname="B", fontfile=find_font(bold=True))
+        heading = rng.choice(HEADINGS)
+        heading_width = pymupdf.Font(fontfile=find_font(bold=True)).text_length(heading, font_size)
+        page.insert_text(((width - heading_width) / 2, margin), heading, fontname="B", fontsize=font_size)
+        lines = [("heading", heading)]
+
+        y = margin + 2 * line_height
+        while y < height - margin - 3 * line_height:
+            for index in range(rng.randint(2, 6)):
+                if y >= height - margin - 3 * line_height:
+                    break
+                x = margin + (indent if index == 0 else 0)
+                text = ""
+                while True:
+                    candidate = f"{text} {rng.choice(WORDS)}".strip()
+                    if regular.text_length(candidate, font_size) > width - margin - x:
+                        break
+                    text = candidate
+                page.insert_text((x, y), text, fontname="R", fontsize=font_size)
+                lines.append(("indent" if index == 0 else "body", text))
+                y += line_height
+            y += line_height / 2
+
+        signature = "Председатель Правительства"
+        page.insert_text((width - margin - regular.text_length(signature, font_size), y + line_height), signature,
+                         fontname="R", fontsize=font_size)
+        lines.append(("signature", signature))
+        layouts.append(lines)
+    document.save(path)
+    return layouts
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print("Usage: python benchmarks/synthetic.py <output_pdf> [pages] [seed]")
+        sys.exit(1)
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    write_pdf(sys.argv[1], pages, seed, sideways_every=10)
+    print(f"Wrote {pages} synthetic pages to {sys.argv[1]}")
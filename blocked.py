@@ -6,44 +6,47 @@ import os
 import sys
 import re
 
+from page_pool import run_tasks, page_number_key
+from tesseract_api import TesseractAPI
+from text_rules import DEFAULT_RULES, load_rules
+from metrics import METRICS
+from deadline import time_left
+from records import BlockRecords
+
+MULTIPLE_SPACES = re.compile(r'\s{2,}')
+
 class BlockExtractor:
-    def __init__(self, image_path, output_dir, tesseract_lang="rus"):
+    # Blank rows between stacked crops in batched mode, so Tesseract never joins two crops into one line.
+    BATCH_GAP = 24
+    # Stay well under Tesseract's image size limits when stacking a dense page.
+    MAX_CANVAS_HEIGHT = 30000
+    # Border of a line crop taken up by its outline and the blur around it; crops no wider or taller than
+    # twice this are always OCR'd.
+    OUTLINE_MARGIN = 2
+
+    def __init__(self, image_path=None, output_dir=None, tesseract_lang="rus", ocr_mode="per_crop",
+                 ocr_backend="pytesseract", correction_rules=DEFAULT_RULES):
+        if ocr_mode not in ("per_crop", "batched"):
+            raise ValueError(f"Unknown OCR mode: {ocr_mode}")
+        if ocr_backend not in ("pytesseract", "tesserocr"):
+            raise ValueError(f"Unknown OCR backend: {ocr_backend}")
         self.image_path = image_path
         self.tesseract_lang = tesseract_lang
+        self.ocr_mode = ocr_mode
+        # Bump the version in the rules file whenever it changes, so cached OCR results are not reused.
+        self.corrections = load_rules(correction_rules)
+        # tesserocr keeps the traineddata loaded for the life of the extractor instead of per call
+        self.api = TesseractAPI(tesseract_lang, psm=6) if ocr_backend == "tesserocr" else None
+        self.deadline = None
         self.output_dir = output_dir
-        os.makedirs(self.output_dir, exist_ok=True)
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
 
     def text_correction(self, given_text: str):
-        replacements = {
-            "|": "1",
-            "No": "№",
-            "СТ.": "ст.",
-            "Ne ": "№",
-            "Nel,": "№ 1,",
-            "5 »": "5»",
-            "№ I": "№ 1",
-            "5‘": "5.1",
-            "BHOCATCA": "вносятся",
-            "Российскои": "Российской",
-            "OT ": "от ",
-            "oT ": "от ",
-            "а} ": "а) ",
-            " обюджетных ": " бюджетных ",
-            "aanHOH; с суб": 'субсидий;".'
-            }
-        
-        for old, new in replacements.items():
-            given_text = given_text.replace(old, new)
-        given_text = re.sub(r"(\d+)'", r"\1.1", given_text)
-        given_text = re.sub(r"(\d+)!", r"\1.1", given_text)
-        given_text = re.sub(r"(\d+)°", r"\1.2", given_text)
-        given_text = re.sub(r"(№ \d+)\?", r"\g<1>2", given_text)
-        given_text = re.sub(r"(\d+)\?", r"\1.2", given_text)
-        given_text = re.sub(r"^([А-Я])\)", lambda match: match.group(1).lower() + ")", given_text)
-        return given_text
+        return self.corrections.apply(given_text)
 
     def process_string(self, input_string: str) -> str:
-        result = re.sub(r'\s{2,}', ' ', input_string)
+        result = MULTIPLE_SPACES.sub(' ', input_string)
         return result
 
     def checker_words(self, textt: str):
@@ -58,17 +61,8 @@ class BlockExtractor:
         else:
             return 2
 
-    def extract_text(self):
-        image = cv2.imread(self.image_path)
-        if image is None:
-            raise FileNotFoundError(f"Image not found at {self.image_path}")
-
-        scale_factor = 1
-        image = cv2.resize(image, (0, 0),
-                           fx=scale_factor,
-                           fy=scale_factor,  
-                           interpolation=cv2.INTER_AREA)
-
+    def find_green_rectangles(self, image):
+        """Recover the line boxes TextLineDetector.draw_lines drew in green (legacy path)."""
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
         lower_green = np.array([40, 40, 40])
         upper_green = np.array([80, 255, 255])
@@ -79,80 +73,282 @@ class BlockExtractor:
             (*cv2.boundingRect(contour), cv2.contourArea(contour)) for contour in contours
         ]
         rectangles.sort(key=lambda rect: rect[1])
+        return rectangles
+
+    def rectangles_from_boxes(self, boxes, image_width, image_height):
+        """Convert LINE_BOX_DTYPE boxes into the (x, y, w, h, area) tuples find_green_rectangles would recover.
+
+        A 1px outline drawn from (x, y) to (x + w, y + h) has a bounding rect one pixel
+        wider and taller than the box and a contour area of w * h, clipped to the page.
+        """
+        rectangles = []
+        for x, y, w, h, _ in boxes:
+            x, y = int(x), int(y)
+            x_end = min(x + int(w), image_width - 1)
+            y_end = min(y + int(h), image_height - 1)
+            if x_end < x or y_end < y:
+                continue
+            rectangles.append((x, y, x_end - x + 1, y_end - y + 1, float((x_end - x) * (y_end - y))))
+        rectangles.sort(key=lambda rect: rect[1])
+        return rectangles
+
+    def outlined_region(self, gray, x, y, w, h):
+        """Crop a line from a grayscale page the way the legacy path saw it, inside its green outline.
+
+        Returns the grayscale crop passed to Tesseract and the average BGR colour
+        used for the bold check, both as if the outline had been drawn.
+        """
+        region = gray[y:y + h, x:x + w].copy()
+        outline = np.zeros(region.shape, dtype=bool)
+        outline[[0, -1], :] = True
+        outline[:, [0, -1]] = True
+
+        inner_sum = float(region[~outline].sum())
+        outline_pixels = int(outline.sum())
+        avg_color = [
+            int(inner_sum / region.size),
+            int((inner_sum + 255 * outline_pixels) / region.size),
+            int(inner_sum / region.size),
+        ]
+        region[outline] = 150  # cv2.COLOR_BGR2GRAY of pure green
+        return region, avg_color
+
+    def binarize_region(self, gray):
+        gray = cv2.GaussianBlur(gray, (3, 3), 0)
+        _, binary_image = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        return binary_image
+
+    def finish_text(self, extracted_text):
+        with METRICS.time("step_seconds", step="correction"):
+            corrected_text = self.text_correction(extracted_text.strip())
+            return self.process_string(corrected_text)
+
+    def is_blank(self, binary_image):
+        """True if a binarized line crop has no ink anywhere, so Tesseract has nothing to read in it.
+
+        Ink in the outline counts too: Tesseract can read a bare frame or rule as a
+        short token such as "[]" that checker_words keeps.
+        """
+        height, width = binary_image.shape[:2]
+        if min(height, width) <= 2 * self.OUTLINE_MARGIN:
+            return False
+        return not (binary_image == 0).any()
+
+    def read_region(self, gray):
+        """Binarize one grayscale line crop and return its corrected Tesseract text."""
+        return self.read_binary(self.binarize_region(gray))
+
+    def read_binary(self, binary_image):
+        METRICS.inc("tesseract_calls_total", call="ocr_crop")
+        with METRICS.time("step_seconds", step="ocr_crop"):
+            timeout = time_left(self.deadline)
+            if self.api is not None:
+                extracted_text = self.api.image_to_string(binary_image, timeout=timeout)
+            else:
+                custom_config = r'--psm 6'
+                extracted_text = pytesseract.image_to_string(binary_image, lang=self.tesseract_lang,
+                                                             config=custom_config, timeout=timeout)
+        return self.finish_text(extracted_text)
+
+    def stack_regions(self, binaries):
+        """Stack binarized crops on white canvases, returning (canvas, [(crop index, top offset)]) pairs."""
+        canvases = []
+        start = 0
+        while start < len(binaries):
+            end = start
+            height = self.BATCH_GAP
+            while end < len(binaries) and (end == start or height + binaries[end].shape[0] + self.BATCH_GAP <= self.MAX_CANVAS_HEIGHT):
+                height += binaries[end].shape[0] + self.BATCH_GAP
+                end += 1
+
+            width = max(binary.shape[1] for binary in binaries[start:end]) + 2 * self.BATCH_GAP
+            canvas = np.full((height, width), 255, dtype=np.uint8)
+            offsets = []
+            top = self.BATCH_GAP
+            for index in range(start, end):
+                h, w = binaries[index].shape
+                canvas[top:top + h, self.BATCH_GAP:self.BATCH_GAP + w] = binaries[index]
+                offsets.append((index, top))
+                top += h + self.BATCH_GAP
+            canvases.append((canvas, offsets))
+            start = end
+        return canvases
+
+    def read_batched(self, binaries):
+        """Return the corrected text of every binarized line crop, stacked into as few Tesseract calls as fit."""
+        lines = [dict() for _ in binaries]
+        for canvas, offsets in self.stack_regions(binaries):
+            METRICS.inc("tesseract_calls_total", call="ocr_batch")
+            with METRICS.time("step_seconds", step="ocr_batch"):
+                timeout = time_left(self.deadline)
+                if self.api is not None:
+                    data = self.api.image_to_data(canvas, timeout=timeout)
+                else:
+                    data = pytesseract.image_to_data(canvas, lang=self.tesseract_lang, config=r'--psm 6',
+                                                     output_type=pytesseract.Output.DICT, timeout=timeout)
+            for i in range(len(data['text'])):
+                word = data['text'][i].strip()
+                if int(data['level'][i]) != 5 or not word:
+                    continue
+                center = data['top'][i] + data['height'][i] / 2
+                for index, top in offsets:
+                    if top - self.BATCH_GAP / 2 <= center < top + binaries[index].shape[0] + self.BATCH_GAP / 2:
+                        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+                        lines[index].setdefault(key, []).append(word)
+                        break
 
-        results = []
-        image_width = image.shape[1]
-        image_height = image.shape[0]
+        # Words keep Tesseract's reading order; lines of one crop are joined the way image_to_string would.
+        return [self.finish_text("\n".join(" ".join(words) for words in crop_lines.values())) for crop_lines in lines]
 
-        for i, (x, y, w, h, area) in enumerate(rectangles):
+    def read_regions(self, grays):
+        """Return the corrected text of every grayscale line crop, in one Tesseract call per page in batched mode.
+
+        Crops that are blank once binarized get no text without going to Tesseract;
+        each one is counted in ocr_regions_skipped_total.
+        """
+        binaries = [self.binarize_region(gray) for gray in grays]
+        texts = [""] * len(binaries)
+        inked = []
+        for index, binary in enumerate(binaries):
+            if self.is_blank(binary):
+                METRICS.inc("ocr_regions_skipped_total")
+            else:
+                inked.append(index)
+
+        if self.ocr_mode == "per_crop":
+            read = [self.read_binary(binaries[index]) for index in inked]
+        else:
+            read = self.read_batched([binaries[index] for index in inked])
+        for index, text in zip(inked, read):
+            texts[index] = text
+        return texts
+
+    def build_records(self, rectangles, texts, colors, image_width, image_height):
+        """Turn y-sorted rectangles and their OCR text into the filtered, renumbered BlockRecords of a page."""
+        boxes = np.array([rectangle[:4] for rectangle in rectangles], dtype=np.int64).reshape(-1, 4)
+        x, y, w, h = boxes.T
+        bottom = y + h
+        # Gaps to the neighbouring rectangles, whether or not their text is kept; the page edges at either end.
+        to_previous = y.copy()
+        to_previous[1:] = y[1:] - bottom[:-1]
+        to_next = image_height - bottom
+        to_next[:-1] = y[1:] - bottom[:-1]
+
+        # Keep texts of at least 2 characters that checker_words accepts.
+        keep = np.array([len(text) >= 2 and self.checker_words(text) > 0 for text in texts], dtype=bool)
+        return BlockRecords.from_columns(
+            [text for text, kept in zip(texts, keep) if kept],
+            order=np.arange(1, int(keep.sum()) + 1),
+            horizontal_length_left=x[keep],
+            horizontal_length_right=image_width - (x + w)[keep],
+            vertical_length_to_previous=to_previous[keep],
+            vertical_length_to_next=to_next[keep],
+            area=[rectangle[4] for rectangle, kept in zip(rectangles, keep) if kept],
+            color_code=[color for color, kept in zip(colors, keep) if kept],
+        )
+
+    def extract_blocks(self, image):
+        """OCR the green-boxed lines of a BGR page array and return the block records."""
+        scale_factor = 1
+        image = cv2.resize(image, (0, 0),
+                           fx=scale_factor,
+                           fy=scale_factor,  
+                           interpolation=cv2.INTER_AREA)
+
+        rectangles = self.find_green_rectangles(image)
+
+        regions = []
+        colors = []
+        for x, y, w, h, _ in rectangles:
             cropped_region = image[y:y + h, x:x + w]
 
             # Calculate average color in the cropped region
             avg_color_per_row = np.mean(cropped_region, axis=0)  # Average across rows
             avg_color = np.mean(avg_color_per_row, axis=0)  # Average across columns
-            avg_color = [int(c) for c in avg_color]  # Convert to integer values
-
-            gray = cv2.cvtColor(cropped_region, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (3, 3), 0)
-            _, binary_image = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            custom_config = r'--psm 6'
-            extracted_text = pytesseract.image_to_string(binary_image, lang=self.tesseract_lang, config=custom_config).strip()
-            corrected_text = self.text_correction(extracted_text)
-            last_corrections = self.process_string(corrected_text)
-
-            horizontal_length_from_right = image_width - (x + w)
-            vertical_length_from_previous = y - rectangles[i - 1][1] - rectangles[i - 1][3] if i > 0 else y
-            vertical_length_to_next = rectangles[i + 1][1] - (y + h) if i < len(rectangles) - 1 else image_height - (y + h)
-
-            results.append({
-                "order": i + 1,
-                "text": last_corrections,
-                "horizontal_length_left": x,
-                "horizontal_length_right": horizontal_length_from_right,
-                "vertical_length_to_previous": vertical_length_from_previous,
-                "vertical_length_to_next": vertical_length_to_next,
-                "area": area,
-                "color_code": avg_color  # Add the average color code here
-            })
-
-        # Filter out results where the length of "text" is less than 2
-        filtered_results = [result for result in results if len(result["text"]) >= 2 and self.checker_words(result['text']) > 0]
-
-        # Reassign order sequentially
-        for new_order, result in enumerate(filtered_results, start=1):
-            result["order"] = new_order
+            colors.append([int(c) for c in avg_color])  # Convert to integer values
+
+            regions.append(cv2.cvtColor(cropped_region, cv2.COLOR_BGR2GRAY))
+
+        texts = self.read_regions(regions)
+        return self.build_records(rectangles, texts, colors, image.shape[1], image.shape[0])
+
+    def fit_region(self, region, target_line_height):
+        """Shrink a line crop more than twice target_line_height tall down to that height; OCR gains nothing from more."""
+        height = region.shape[0]
+        if not target_line_height or height <= 2 * target_line_height:
+            return region
+        factor = target_line_height / height
+        return cv2.resize(region, (0, 0), fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+
+    def extract_blocks_from_boxes(self, page, boxes, scale=1.0, target_line_height=None):
+        """OCR the LINE_BOX_DTYPE boxes of a page array directly, without drawing and re-detecting them.
+
+        For a page not rendered at 200 dpi, scale (200 / its dpi) maps the records back
+        to 200 dpi coordinates, which the DOCX layout rules are tuned for. With
+        target_line_height, tall crops such as headings are shrunk before OCR.
+        """
+        gray = page if page.ndim == 2 else cv2.cvtColor(page, cv2.COLOR_BGR2GRAY)
+        image_height, image_width = gray.shape
+        rectangles = self.rectangles_from_boxes(boxes, image_width, image_height)
+
+        regions = []
+        colors = []
+        for x, y, w, h, _ in rectangles:
+            region, avg_color = self.outlined_region(gray, x, y, w, h)
+            regions.append(self.fit_region(region, target_line_height))
+            colors.append(avg_color)
+
+        texts = self.read_regions(regions)
+        if scale != 1:
+            rectangles = [(int(round(x * scale)), int(round(y * scale)), int(round(w * scale)), int(round(h * scale)),
+                           area * scale * scale) for x, y, w, h, area in rectangles]
+            image_width, image_height = int(round(image_width * scale)), int(round(image_height * scale))
+        return self.build_records(rectangles, texts, colors, image_width, image_height)
+
+    def extract_text(self):
+        image = cv2.imread(self.image_path)
+        if image is None:
+            raise FileNotFoundError(f"Image not found at {self.image_path}")
+
+        filtered_results = self.extract_blocks(image)
 
         json_filename = os.path.basename(self.image_path).rsplit('.', 1)[0] + '.json'
         output_file = os.path.join(self.output_dir, json_filename)
 
         with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(filtered_results, f, ensure_ascii=False, indent=4)
+            json.dump(filtered_results.to_dicts(), f, ensure_ascii=False, indent=4)
 
         print(f"Results saved to {output_file}")
         return output_file
 
 
-def process_directory(input_directory, output_directory):
+def process_file(input_image_path, output_directory):
+    extractor = BlockExtractor(input_image_path, output_directory)
+    return extractor.extract_text()
+
+
+def process_directory(input_directory, output_directory, workers=1):
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    for filename in os.listdir(input_directory):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            input_image_path = os.path.join(input_directory, filename)
-            try:
-                extractor = BlockExtractor(input_image_path, output_directory)
-                extractor.extract_text()
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
+    filenames = sorted(
+        (f for f in os.listdir(input_directory) if f.lower().endswith(('.png', '.jpg', '.jpeg'))),
+        key=page_number_key
+    )
+    tasks = [(os.path.join(input_directory, filename), output_directory) for filename in filenames]
+
+    for filename, error in zip(filenames, run_tasks(process_file, tasks, workers)):
+        if isinstance(error, Exception):
+            print(f"Error processing {filename}: {error}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python blocked.py <rectangled_path> <output_path>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python blocked.py <rectangled_path> <output_path> [workers]")
         sys.exit(1)
 
     rectangled_path = sys.argv[1]
     output_path = sys.argv[2]
+    workers = int(sys.argv[3]) if len(sys.argv) == 4 else 1
 
-    process_directory(rectangled_path, output_path)
+    process_directory(rectangled_path, output_path, workers)
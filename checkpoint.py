@@ -0,0 +1,164 @@
+import os
+import re
+import json
+import hashlib
+
+from records import BlockRecords
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class RunManifest:
+    """Record of what an exp_N run has finished, so an interrupted run can resume where it stopped.
+
+    manifest.json identifies the run (PDF checksum and settings digest) and, once
+    every page has converted, the DOCX it wrote and the page count. pages.jsonl is an append-only journal with
+    one line per finished page stage, naming the stage's output file and its
+    checksum. A page is only skipped on resume if its output still matches.
+    """
+
+    MANIFEST = "manifest.json"
+    JOURNAL = "pages.jsonl"
+    # Page outputs written by PipelineEngine.save_page, relative to the run folder.
+    STAGE_FILES = {
+        "rasterize": os.path.join("images", "page_{}.jpeg"),
+        "extract_blocks": os.path.join("jsons", "processed_page_{}.json"),
+    }
+
+    def __init__(self, run_dir, pdf_file, settings_digest):
+        self.run_dir = run_dir
+        self.pdf_file = pdf_file
+        self.pdf_digest = file_digest(pdf_file)
+        self.settings_digest = settings_digest
+        self.pages = {}
+        self.output = None
+
+    @classmethod
+    def open(cls, run_dir, pdf_file, settings_digest, resume=False):
+        """Load the run in run_dir if resume is set and it matches, otherwise start a fresh manifest there."""
+        manifest = cls(run_dir, pdf_file, settings_digest)
+        if not (resume and manifest.load()):
+            manifest.start()
+        return manifest
+
+    def path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def read_header(self):
+        try:
+            with open(self.path(self.MANIFEST), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def matches(self):
+        """True if run_dir holds a run of the same PDF with the same settings."""
+        header = self.read_header()
+        return (header is not None and header.get("pdf_sha256") == self.pdf_digest
+                and header.get("settings_digest") == self.settings_digest)
+
+    def load(self):
+        """Replay the journal of a matching run and return True, or return False if there is none."""
+        if not self.matches():
+            return False
+        self.output = self.read_header().get("output")
+        try:
+            with open(self.path(self.JOURNAL), "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash; that stage simply runs again.
+                        continue
+                    self.pages.setdefault(entry["page"], {})[entry["stage"]] = entry
+        except FileNotFoundError:
+            pass
+        return True
+
+    def start(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.write_header()
+        open(self.path(self.JOURNAL), "w").close()
+
+    def write_header(self):
+        header = {
+            "pdf_file": os.path.abspath(self.pdf_file),
+            "pdf_sha256": self.pdf_digest,
+            "settings_digest": self.settings_digest,
+            "output": self.output,
+        }
+        tmp_path = self.path(self.MANIFEST + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.path(self.MANIFEST))
+
+    def record_page(self, page_number):
+        """Journal every stage output of page_number that exists on disk, with its checksum."""
+        lines = []
+        for stage, pattern in self.STAGE_FILES.items():
+            relative = pattern.format(page_number)
+            if not os.path.exists(self.path(relative)):
+                continue
+            entry = {"page": page_number, "stage": stage, "file": relative, "sha256": file_digest(self.path(relative))}
+            self.pages.setdefault(page_number, {})[stage] = entry
+            lines.append(json.dumps(entry) + "\n")
+        if lines:
+            with open(self.path(self.JOURNAL), "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def valid_output(self, page_number, stage):
+        """Path of a journaled stage output that still exists unchanged, or None."""
+        entry = self.pages.get(page_number, {}).get(stage)
+        if entry is None:
+            return None
+        path = self.path(entry["file"])
+        if not os.path.exists(path) or file_digest(path) != entry["sha256"]:
+            return None
+        return path
+
+    def finished_pages(self):
+        """Block records of every page whose extract_blocks output is still valid, by page number."""
+        finished = {}
+        for page_number in sorted(self.pages):
+            path = self.valid_output(page_number, "extract_blocks")
+            if path is None:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                finished[page_number] = BlockRecords.from_dicts(json.load(f))
+        return finished
+
+    def complete(self, output_docx, page_count):
+        """Record output_docx as the run's result; only call once all page_count pages are journaled."""
+        self.output = {"file": os.path.abspath(output_docx), "sha256": file_digest(output_docx), "pages": page_count}
+        self.write_header()
+
+    def finished_output(self, output_docx):
+        """True if this run already wrote output_docx, the file is unchanged and every page is still journaled."""
+        if self.output is None or self.output.get("pages") is None:
+            return False
+        if not (self.output["file"] == os.path.abspath(output_docx) and os.path.exists(output_docx)
+                and file_digest(output_docx) == self.output["sha256"]):
+            return False
+        return all(self.valid_output(page_number, "extract_blocks") is not None
+                   for page_number in range(1, self.output["pages"] + 1))
+
+
+def find_resumable_run(base_path, pdf_file, settings_digest):
+    """The newest exp_N folder under base_path holding a run of pdf_file with these settings, or None."""
+    runs = []
+    for name in os.listdir(base_path):
+        match = re.fullmatch(r"exp_(\d+)", name)
+        if match and os.path.isdir(os.path.join(base_path, name)):
+            runs.append((int(match.group(1)), os.path.join(base_path, name)))
+    for _, run_dir in sorted(runs, reverse=True):
+        if RunManifest(run_dir, pdf_file, settings_digest).matches():
+            return run_dir
+    return None
@@ -3,11 +3,15 @@ import json
 import sys
 import re
 
+from records import BlockRecords
+
 class JSONConcatenator:
-    def __init__(self, json_directory, output_file="concatenated.json"):
+    def __init__(self, json_directory=None, output_file="concatenated.json"):
         self.json_directory = json_directory
         self.output_file = output_file
         self.concatenated_data = []
+        # Pages added as BlockRecords, joined by concatenated() rather than one dict at a time.
+        self.record_pages = []
         self.current_order = 1
 
     def validate_directory(self):
@@ -26,25 +30,73 @@ class JSONConcatenator:
         )
         return json_files
 
-    def process_file(self, json_path):
+    def renumber_page(self, data):
+        """Renumber one page of block records to follow the previous pages."""
+        for entry in data:
+            # Update vertical_length_to_previous for the first order
+            if entry["order"] == 1:
+                entry["vertical_length_to_previous"] = 10  # Set to desired value
+
+            entry["order"] = self.current_order
+            self.current_order += 1
+        return data
+
+    def add_page(self, data):
+        """Append one page of block records (BlockRecords or dicts), renumbering them after the previous pages."""
+        if isinstance(data, BlockRecords) and not self.concatenated_data:
+            self.record_pages.append(data)
+            return
+        if isinstance(data, BlockRecords):
+            data = data.to_dicts()
+        elif self.record_pages:
+            self.record_pages.append(BlockRecords.from_dicts(data))
+            return
+        self.concatenated_data.extend(self.renumber_page(data))
+
+    def concatenated(self):
+        """Every page added so far: one BlockRecords if they came as BlockRecords, otherwise the renumbered dicts."""
+        if self.record_pages:
+            return BlockRecords.concatenate(self.record_pages)
+        return self.concatenated_data
+
+    def read_page(self, json_path):
+        """Load one page file, or return None after reporting why it could not be read."""
         try:
             with open(json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-                for entry in data:
-                    # Update vertical_length_to_previous for the first order
-                    if entry["order"] == 1:
-                        entry["vertical_length_to_previous"] = 10  # Set to desired value
-                
-                    entry["order"] = self.current_order
-                    self.current_order += 1
-
-                self.concatenated_data.extend(data)
-
+                return json.load(f)
         except json.JSONDecodeError:
             print(f"Error: {json_path} is not a valid JSON file.")
         except Exception as e:
             print(f"Error processing {json_path}: {e}")
+        return None
+
+    def process_file(self, json_path):
+        data = self.read_page(json_path)
+        if data is not None:
+            self.add_page(data)
+
+    def iter_records(self):
+        """Yield the renumbered records of every page file in page order, one page in memory at a time."""
+        self.validate_directory()
+        for json_file in self.get_sorted_files():
+            # Only page files; an earlier concatenated.json would repeat every record.
+            if not re.search(r"processed_page_(\d+)", json_file):
+                continue
+            data = self.read_page(os.path.join(self.json_directory, json_file))
+            if data is not None:
+                yield from self.renumber_page(data)
+
+    def concatenate_stream(self):
+        """Write the pages as newline-delimited JSON, one record per line, without loading them all."""
+        output_path = os.path.join(self.json_directory, self.output_file)
+        # Write next to the page files under a name get_sorted_files does not pick up.
+        with open(output_path, "w", encoding="utf-8") as f:
+            for entry in self.iter_records():
+                f.write(json.dumps(entry, ensure_ascii=False))
+                f.write("\n")
+
+        print(f"Concatenated NDJSON saved to {output_path}")
+        return output_path
 
     def concatenate(self):
         self.validate_directory()
@@ -63,15 +115,17 @@ class JSONConcatenator:
 
     @staticmethod
     def run_from_command_line():
-        if len(sys.argv) != 2:
-            print("Usage: python conc_jsons.py <json_output_path>")
+        if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and sys.argv[2] != "--ndjson"):
+            print("Usage: python conc_jsons.py <json_output_path> [--ndjson]")
             sys.exit(1)
 
         json_output_path = sys.argv[1]
 
         try:
-            concatenator = JSONConcatenator(json_output_path)
-            concatenator.concatenate()
+            if len(sys.argv) == 3:
+                JSONConcatenator(json_output_path, output_file="concatenated.ndjson").concatenate_stream()
+            else:
+                JSONConcatenator(json_output_path).concatenate()
         except Exception as e:
             print(f"Error: {e}")
 
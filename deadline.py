@@ -0,0 +1,17 @@
+import time
+
+
+def time_left(deadline):
+    """Seconds until deadline, a time.time() value, as a timeout for one Tesseract or poppler call.
+
+    Returns None, which pytesseract and pdf2image take as no timeout, when there is
+    no deadline, and raises TimeoutError once it has passed. The deadline is on the
+    time.time() clock rather than a monotonic one, because it is handed to pool
+    worker processes.
+    """
+    if deadline is None:
+        return None
+    left = deadline - time.time()
+    if left <= 0:
+        raise TimeoutError("The job ran out of time")
+    return left
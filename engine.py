@@ -0,0 +1,612 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from collections import deque
+
+import cv2
+import numpy as np
+
+from pdf2jpeg import PDFToJPEG
+from page_store import PageStore, PageRef
+from new_raws import TextLineDetector, scale_boxes
+from blocked import BlockExtractor
+from records import BlockRecords
+from conc_jsons import JSONConcatenator
+from write_docx import JSONToDocxConverter
+from page_pool import PagePool
+from result_cache import ResultCache
+from text_rules import DEFAULT_RULES
+from metrics import METRICS
+from text_layer import TextLayerReader, available as text_layer_available
+from stage_pipeline import Stage, StagePipeline
+
+# Marks the end of an iterator whose items may themselves be None.
+END = object()
+
+
+class PageWork:
+    """One page on its way through PipelineEngine.detect_page and extract_page."""
+
+    def __init__(self, page_number, page, debug_dir=None, source=None):
+        self.page_number = page_number
+        self.page = page
+        self.debug_dir = debug_dir
+        self.source = source
+        self.boxes = None
+        self.rectangled = None
+        self.records = None
+        self.failed = False
+        self.start = None
+
+
+class PipelineEngine:
+    """Run every conversion stage in one process, handing data between stages in memory."""
+
+    STAGES = ("cache", "text_layer", "rasterize", "detect_lines", "extract_blocks", "page_pool", "concatenate",
+              "write_docx")
+    # Block record coordinates are always in pixels at this resolution.
+    REFERENCE_DPI = 200
+    # resolution="adaptive": lines are found on a LAYOUT_DPI render, then each page is rendered again at the
+    # lowest OCR_DPIS step that makes nine in ten of its lines TARGET_LINE_HEIGHT pixels tall.
+    LAYOUT_DPI = 100
+    # Never above REFERENCE_DPI: small print is OCR'd at the fixed mode's resolution rather than rendered
+    # with more pixels than it, until a bench_resolution run shows the accuracy is worth them.
+    OCR_DPIS = (100, 150, 200)
+    # Lines of 12 pt body text are 14-17 px tall at LAYOUT_DPI, so such scans are OCR'd at 150-200 dpi.
+    # Typeset glyphs render crisply, so pages with a text layer get by with fewer pixels than scans.
+    TARGET_LINE_HEIGHT = {"scan": 22, "text": 16}
+
+    def __init__(self, tesseract_lang="rus", pixel_expansion=0, legacy_green_boxes=False,
+                 workers=1, max_in_flight=None, ocr_mode="per_crop", ocr_backend="pytesseract", pool=None,
+                 raster_chunk_size=4, cache=None, correction_rules=DEFAULT_RULES, resolution="fixed", text_layer=True,
+                 overlap=True, raster_threads=1, detect_threads=1, ocr_threads=1, queue_size=2,
+                 page_store=True, page_store_dir=None, render_pool=None, deadline=None):
+        if resolution not in ("fixed", "adaptive"):
+            raise ValueError(f"Unknown resolution mode: {resolution}")
+        if resolution == "adaptive" and legacy_green_boxes:
+            raise ValueError("The adaptive resolution mode needs line boxes, not legacy green boxes")
+        self.resolution = resolution
+        self.render_dpi = self.LAYOUT_DPI if resolution == "adaptive" else self.REFERENCE_DPI
+        self.tesseract_lang = tesseract_lang
+        self.pixel_expansion = pixel_expansion
+        self.legacy_green_boxes = legacy_green_boxes
+        self.ocr_mode = ocr_mode
+        self.ocr_backend = ocr_backend
+        self.correction_rules = correction_rules
+        # A shared pool (e.g. the server's WarmPagePool) is never closed here, and its
+        # workers' own settings decide how pages are processed.
+        self.pool = pool
+        self.workers = pool.workers if pool is not None else workers
+        self.max_in_flight = max_in_flight
+        self.raster_chunk_size = raster_chunk_size
+        # With overlap, rendering, line detection and OCR run at the same time on consecutive pages,
+        # each with its own threads, joined by queues of queue_size pages.
+        self.overlap = overlap
+        self.raster_threads = raster_threads
+        self.detect_threads = detect_threads
+        self.ocr_threads = ocr_threads
+        self.queue_size = queue_size
+        # Pages go to pool workers through a memory-mapped PageStore in page_store_dir instead of being pickled.
+        self.page_store = page_store
+        self.page_store_dir = page_store_dir
+        self.owner_thread = threading.current_thread()
+        self.thread_tools = threading.local()
+        self.timings_lock = threading.Lock()
+        # With a render_pool (e.g. the server's, whose workers run under a memory limit), poppler and the
+        # text layer pass run in its workers, with their own settings, instead of in this process.
+        self.render_pool = render_pool
+        self.converter = PDFToJPEG(render_pool=render_pool)
+        self.detector = TextLineDetector(pixel_expansion=pixel_expansion, ocr_backend=ocr_backend)
+        self.extractor = BlockExtractor(tesseract_lang=tesseract_lang, ocr_mode=ocr_mode, ocr_backend=ocr_backend,
+                                        correction_rules=correction_rules)
+        # Typeset pages are read from the PDF's text layer when PyMuPDF is installed; only scans are OCR'd.
+        self.text_reader = TextLayerReader(self.extractor) if text_layer and text_layer_available() else None
+        self.set_deadline(deadline)
+        self.cache = cache
+        self.cache_digest = self.settings_digest() if cache is not None else None
+        self.timings = {}
+        # Pages of the last run that produced no records and are missing from its DOCX.
+        self.failed_pages = []
+
+    @contextmanager
+    def stage(self, name):
+        """Accumulate the wall time spent inside the block under the given stage name, and record it in METRICS."""
+        start = time.perf_counter()
+        try:
+            with METRICS.time("stage_seconds", stage=name):
+                yield
+        finally:
+            self.add_timing(name, time.perf_counter() - start)
+
+    def add_timing(self, name, seconds):
+        with self.timings_lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def timed_iter(self, name, iterable):
+        """Yield from iterable, charging the time spent producing each item to the named stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, END)
+            if item is END:
+                return
+            yield item
+
+    def report_timings(self):
+        for name in self.STAGES:
+            if name in self.timings:
+                print(f"  {name:<15} {self.timings[name]:.03f}s")
+        if self.workers > 1:
+            print(f"  (detect_lines and extract_blocks are summed over {self.workers} workers)")
+
+    def save_page(self, debug_dir, page_number, page, rectangled, records):
+        """Write one page's intermediates in the old exp_N layout, for debugging only."""
+        images_path = os.path.join(debug_dir, "images")
+        rectangled_path = os.path.join(debug_dir, "rectangled_images")
+        json_path = os.path.join(debug_dir, "jsons")
+        for path in (images_path, rectangled_path, json_path):
+            os.makedirs(path, exist_ok=True)
+
+        if page is not None:
+            cv2.imwrite(os.path.join(images_path, f"page_{page_number}.jpeg"), page)
+        if rectangled is not None:
+            cv2.imwrite(os.path.join(rectangled_path, f"processed_page_{page_number}.jpeg"), rectangled)
+        if records is not None:
+            with open(os.path.join(json_path, f"processed_page_{page_number}.json"), "w", encoding="utf-8") as f:
+                json.dump(records.to_dicts(), f, ensure_ascii=False, indent=4)
+
+    def save_concatenated(self, debug_dir, data):
+        json_path = os.path.join(debug_dir, "jsons")
+        os.makedirs(json_path, exist_ok=True)
+        if isinstance(data, BlockRecords):
+            data = data.to_dicts()
+        with open(os.path.join(json_path, "concatenated.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+
+    def ocr_dpi(self, boxes, has_text_layer=False):
+        """Return (dpi, target line height) for the lines found on a LAYOUT_DPI render.
+
+        dpi is the lowest OCR_DPIS step at which nine in ten of them are at least the
+        TARGET_LINE_HEIGHT for the page's kind tall.
+        """
+        target = self.TARGET_LINE_HEIGHT["text" if has_text_layer else "scan"]
+        needed = self.LAYOUT_DPI * target / max(float(np.percentile(boxes["h"], 10)), 1.0)
+        for dpi in self.OCR_DPIS:
+            if dpi >= needed:
+                return dpi, target
+        return self.OCR_DPIS[-1], target
+
+    def set_deadline(self, deadline):
+        """Give every Tesseract and poppler call from now on only the time left until deadline, a time.time() value.
+
+        The deadline is set on the PDFToJPEG, TextLineDetector and BlockExtractor, whose
+        calls take deadline.time_left(self.deadline) as their timeout. A call that runs
+        out fails its page; None lifts the limit.
+        """
+        self.deadline = deadline
+        for tool in (self.converter, self.detector, self.extractor):
+            tool.deadline = deadline
+
+    def page_tools(self):
+        """The (detector, extractor) pair for the calling thread.
+
+        tesserocr handles must not be shared between threads, so stage threads other
+        than the one that built the engine get their own; pytesseract starts a fresh
+        Tesseract process per call and needs no copies.
+        """
+        if self.ocr_backend == "pytesseract" or threading.current_thread() is self.owner_thread:
+            return self.detector, self.extractor
+        tools = getattr(self.thread_tools, "tools", None)
+        if tools is None:
+            tools = self.thread_tools.tools = (
+                TextLineDetector(pixel_expansion=self.pixel_expansion, ocr_backend=self.ocr_backend),
+                BlockExtractor(tesseract_lang=self.tesseract_lang, ocr_mode=self.ocr_mode,
+                               ocr_backend=self.ocr_backend, correction_rules=self.correction_rules),
+            )
+            for tool in tools:
+                tool.deadline = self.deadline
+        return tools
+
+    def page_failed(self, work, error):
+        print(f"Error processing page {work.page_number}: {error}")
+        METRICS.inc("page_errors_total")
+        work.failed = True
+
+    def detect_page(self, work):
+        """First half of process_page: find the lines of a PageWork's page."""
+        METRICS.inc("pages_total", source="ocr")
+        work.start = time.perf_counter()
+        detector, _ = self.page_tools()
+        try:
+            with self.stage("detect_lines"):
+                if self.legacy_green_boxes:
+                    work.rectangled = detector.draw_lines(cv2.cvtColor(work.page, cv2.COLOR_GRAY2BGR))
+                else:
+                    work.boxes = detector.detect_lines(work.page, self.LAYOUT_DPI if work.source else None)
+        except Exception as e:
+            self.page_failed(work, e)
+        return work
+
+    def extract_page(self, work):
+        """Second half of process_page: OCR the lines detect_page found and set work.records."""
+        detector, extractor = self.page_tools()
+        try:
+            if work.failed:
+                pass
+            elif self.legacy_green_boxes:
+                with self.stage("extract_blocks"):
+                    work.records = extractor.extract_blocks(work.rectangled)
+            else:
+                page, boxes = work.page, work.boxes
+                scale, target = 1.0, None
+                if work.source is not None and len(boxes):
+                    pdf_file, angle, has_text_layer = work.source
+                    dpi, target = self.ocr_dpi(boxes, has_text_layer)
+                    METRICS.inc("ocr_dpi_pages_total", dpi=dpi)
+                    if dpi != self.LAYOUT_DPI:
+                        # Large print is OCR'd on the layout render itself, with the boxes found on it.
+                        with self.stage("rasterize"):
+                            page = work.page = self.converter.render_page(pdf_file, work.page_number, dpi, angle)
+                        factor = dpi / self.LAYOUT_DPI
+                        boxes = scale_boxes(boxes, factor, padding=int(np.ceil(factor)))
+                    scale = self.REFERENCE_DPI / dpi
+                with self.stage("extract_blocks"):
+                    work.records = extractor.extract_blocks_from_boxes(page, boxes, scale, target)
+                if work.debug_dir:
+                    work.rectangled = detector.draw_boxes(cv2.cvtColor(page, cv2.COLOR_GRAY2BGR), boxes)
+        except Exception as e:
+            self.page_failed(work, e)
+        METRICS.observe("page_seconds", time.perf_counter() - work.start)
+
+        if work.debug_dir:
+            self.save_page(work.debug_dir, work.page_number, work.page, work.rectangled, work.records)
+        return work
+
+    def process_page(self, page_number, page, debug_dir=None, source=None):
+        """Detect and OCR the lines of one grayscale page array, returning its block records or None.
+
+        source, given in the adaptive resolution mode, is (pdf_file, angle, has_text_layer)
+        for a page rendered at LAYOUT_DPI: its lines are found on that render and OCR'd on
+        a second render at the resolution they need.
+        """
+        return self.extract_page(self.detect_page(PageWork(page_number, page, debug_dir, source))).records
+
+    @contextmanager
+    def open_pool(self):
+        """Yield the shared pool, or a PagePool of this engine's own, started and closed under the page_pool stage."""
+        if self.pool is not None:
+            yield self.pool
+            return
+        with self.stage("page_pool"):
+            pool = PagePool(self.workers, self.max_in_flight, PipelineEngine, self.worker_kwargs())
+        try:
+            yield pool
+        finally:
+            with self.stage("page_pool"):
+                pool.close()
+
+    def process_page_timed(self, page_number, page, debug_dir=None, source=None, deadline=None):
+        """Run process_page in a pool worker and return its records, the stage times it took and its METRICS delta.
+
+        page may be a PageRef, read in place from the parent's PageStore. deadline is
+        that of the engine the page comes from; see set_deadline.
+        """
+        self.timings = {}
+        self.set_deadline(deadline)
+        if isinstance(page, PageRef):
+            page = page.load()
+        records = self.process_page(page_number, page, debug_dir, source)
+        return records, self.timings, METRICS.take_delta()
+
+    def share_page(self, store, page, slots):
+        """Return (store, what to send a pool worker for page): a PageRef into store, created on the first page, or the page itself."""
+        if not self.page_store or not PageStore.storable(page):
+            return store, page
+        if store is None:
+            store = PageStore.temporary(slots, page, self.page_store_dir)
+        ref = store.add(page)
+        return store, page if ref is None else ref
+
+    def cache_settings(self):
+        """Everything that changes the block records a page produces, for cache keys."""
+        settings = {
+            "dpi": self.REFERENCE_DPI if self.resolution == "fixed" else self.resolution,
+            "tesseract_lang": self.tesseract_lang,
+            "pixel_expansion": self.pixel_expansion,
+            "legacy_green_boxes": self.legacy_green_boxes,
+            "ocr_mode": self.ocr_mode,
+            "correction_rules": self.extractor.corrections.key,
+            "text_layer": self.text_reader is not None,
+        }
+        if self.resolution == "adaptive":
+            settings["target_line_height"] = self.TARGET_LINE_HEIGHT
+            settings["ocr_dpis"] = self.OCR_DPIS
+        return settings
+
+    def settings_digest(self):
+        return ResultCache.settings_digest(self.cache_settings())
+
+    def worker_kwargs(self):
+        """Constructor arguments that reproduce this engine's page processing inside a pool worker."""
+        return {
+            "tesseract_lang": self.tesseract_lang,
+            "pixel_expansion": self.pixel_expansion,
+            "legacy_green_boxes": self.legacy_green_boxes,
+            "ocr_mode": self.ocr_mode,
+            "ocr_backend": self.ocr_backend,
+            "correction_rules": self.correction_rules,
+            "resolution": self.resolution,
+        }
+
+    def iter_page_records(self, pages, debug_dir=None):
+        """Yield (page_number, records) for (page_number, page, source) items in order, in a process pool when workers > 1.
+
+        With overlap, pages are taken from pages on a thread of their own, so rendering
+        the next pages goes on while earlier ones are detected and OCR'd.
+        """
+        if self.pool is None and self.workers <= 1:
+            if not self.overlap:
+                for page_number, page, source in pages:
+                    yield page_number, self.process_page(page_number, page, debug_dir, source)
+                return
+            stages = StagePipeline([
+                Stage("detect_lines", self.detect_page, self.detect_threads),
+                Stage("extract_blocks", self.extract_page, self.ocr_threads),
+            ], self.queue_size)
+            works = (PageWork(page_number, page, debug_dir, source) for page_number, page, source in pages)
+            for work in stages.run(works):
+                yield work.page_number, work.records
+            return
+
+        if self.overlap:
+            # The pool is the detect and OCR stage; keep rendering ahead of it in the meantime.
+            pages = StagePipeline([], self.queue_size).run(pages)
+
+        page_numbers = deque()
+        store = None
+        # Time tasks() spends drawing pages, which their own stages (rasterize, cache) already count.
+        drawing = 0.0
+
+        def tasks():
+            nonlocal store, drawing
+            iterator = iter(pages)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, END)
+                drawing += time.perf_counter() - start
+                if item is END:
+                    return
+                page_number, page, source = item
+                store, page = self.share_page(store, page, slots)
+                page_numbers.append((page_number, page))
+                yield page_number, page, debug_dir, source, self.deadline
+
+        with self.open_pool() as pool:
+            # Pages between tasks() and the consumer never exceed the in-flight limit.
+            slots = (self.max_in_flight or pool.max_in_flight) + 1
+            try:
+                # A shared pool's own limit is for all documents; max_in_flight is this one's share.
+                results = pool.imap_state("process_page_timed", tasks(), return_exceptions=True,
+                                          max_in_flight=self.max_in_flight)
+                while True:
+                    # page_pool counts the wait for each result, not the time the caller spends between them.
+                    start, drawn = time.perf_counter(), drawing
+                    result = next(results, END)
+                    seconds = time.perf_counter() - start - (drawing - drawn)
+                    METRICS.observe("stage_seconds", seconds, stage="page_pool")
+                    self.add_timing("page_pool", seconds)
+                    if result is END:
+                        break
+                    page_number, page = page_numbers.popleft()
+                    if isinstance(page, PageRef):
+                        store.release(page)
+                    if isinstance(result, Exception):
+                        print(f"Error processing page {page_number}: {result}")
+                        yield page_number, None
+                        continue
+                    yield page_number, self.merge_timed_result(result)
+            finally:
+                if store is not None:
+                    store.close(remove=True)
+
+    def iter_pages_to_process(self, pdf_file, cached, keys, converter=None, finished=None):
+        """Yield (page_number, page, source) for every page of pdf_file that still needs OCR, rendering lazily.
+
+        With a cache, pages seen before go into cached instead, and the cache keys of
+        the others into keys, both by page number. Pages in finished, the records a
+        resumed run already has, and pages read from the PDF's text layer go into
+        cached too and are not even rendered. converter defaults to the
+        engine's own; pass a separate PDFToJPEG to render several documents side by side.
+        source is None except in the adaptive resolution mode; see process_page.
+        """
+        converter = converter or self.converter
+        finished = finished or {}
+        text_pages = {}
+        if self.text_reader is not None:
+            with self.stage("text_layer"):
+                text_pages = self.read_text_layer(pdf_file, set(finished))
+        text_layer_pages = converter.text_layer_pages(pdf_file) if self.resolution == "adaptive" else ()
+        rendered = converter.iter_rendered_pages(pdf_file, self.raster_chunk_size, in_memory=True,
+                                                 skip_pages=set(finished) | set(text_pages), dpi=self.render_dpi,
+                                                 render_threads=self.raster_threads)
+        for page_number, image in enumerate(self.timed_iter("rasterize", rendered), start=1):
+            if page_number in finished:
+                cached[page_number] = finished[page_number]
+                METRICS.inc("pages_total", source="checkpoint")
+                continue
+            if page_number in text_pages:
+                cached[page_number] = text_pages.pop(page_number)
+                METRICS.inc("pages_total", source="text_layer")
+                continue
+            if self.cache is not None:
+                with self.stage("cache"):
+                    key = self.cache.page_key(np.asarray(image), self.cache_digest)
+                    records = self.cache.get_page(key)
+                if records is not None:
+                    cached[page_number] = records
+                    METRICS.inc("pages_total", source="cache")
+                    continue
+                keys[page_number] = key
+            with self.stage("rasterize"):
+                page = np.asarray(converter.process_page(image))
+            source = None
+            if self.resolution == "adaptive":
+                source = (pdf_file, converter.orientation_log[-1][1], page_number in text_layer_pages)
+            yield page_number, page, source
+
+    def read_text_layer(self, pdf_file, skip_pages):
+        if self.render_pool is not None:
+            return self.render_pool.call("text_reader.read_document", pdf_file, skip_pages)
+        return self.text_reader.read_document(pdf_file, skip_pages=skip_pages)
+
+    def cache_page(self, key, records):
+        with self.stage("cache"):
+            self.cache.put_page(key, records)
+
+    def merge_timed_result(self, result):
+        """Merge the stage times and METRICS of a process_page_timed result from a pool worker and return its records."""
+        records, timings, metrics = result
+        METRICS.merge(metrics)
+        with self.timings_lock:
+            for name, seconds in timings.items():
+                self.timings[name] = self.timings.get(name, 0.0) + seconds
+        return records
+
+    def record_page(self, page_number, records, keys, failed_pages, manifest=None):
+        """Take in the records of a page that went through OCR, None if it failed.
+
+        A failed page is added to failed_pages. A good one is cached under its key in
+        keys, if it has one, and journaled in manifest, if given.
+        """
+        if records is None:
+            failed_pages.append(page_number)
+            return
+        if page_number in keys:
+            # Keys hash the rendered pixels: a good page is safe to cache even if the document ends up partial.
+            self.cache_page(keys.pop(page_number), records)
+        if manifest is not None:
+            manifest.record_page(page_number)
+
+    def iter_document_records(self, pdf_file, debug_dir=None, manifest=None):
+        """Yield (page_number, records) for every page of pdf_file in order.
+
+        Pages are rendered lazily, so at most one raster chunk plus the pages in flight
+        are in memory. With a cache, a page whose rendered pixels were seen before skips
+        orientation and OCR entirely, and each newly OCR'd page is added to the cache as
+        it finishes, whether or not the rest of the document converts. Pages that fail
+        are added to failed_pages and yielded with records None. With a RunManifest, pages the run
+        already finished are reused and every other page that converts is journaled,
+        including those read from the text layer or the cache.
+        """
+        cached = {}
+        keys = {}
+        finished = manifest.finished_pages() if manifest is not None else None
+        if finished:
+            print(f"Resuming: {len(finished)} pages already finished in {manifest.run_dir}")
+        pages_to_process = self.iter_pages_to_process(pdf_file, cached, keys, finished=finished)
+
+        def take_cached(page_number):
+            records = cached.pop(page_number)
+            if manifest is not None and not (finished and page_number in finished):
+                # Journal pages that skipped OCR too, so the manifest covers every page of a complete run.
+                self.save_page(manifest.run_dir, page_number, None, None, records)
+                manifest.record_page(page_number)
+            return records
+
+        self.converter.reset_orientation()
+        next_page = 1
+        for page_number, records in self.iter_page_records(pages_to_process, debug_dir):
+            while next_page < page_number:
+                yield next_page, take_cached(next_page)
+                next_page += 1
+            self.record_page(page_number, records, keys, self.failed_pages, manifest)
+            yield page_number, records
+            next_page = page_number + 1
+        while next_page in cached:
+            yield next_page, take_cached(next_page)
+            next_page += 1
+        print(self.converter.orientation_summary())
+
+    def restore_document(self, pdf_file, output_docx):
+        """Return (document_key, reused); reused is True if a cached conversion was written to output_docx."""
+        if self.cache is None:
+            return None, False
+        with self.stage("cache"):
+            document_key = self.cache.document_key(pdf_file, self.cache_digest)
+            docx_bytes = self.cache.get_docx(document_key)
+        if docx_bytes is None:
+            return document_key, False
+        with open(output_docx, "wb") as f:
+            f.write(docx_bytes)
+        METRICS.inc("documents_total", source="cache")
+        print(f"Reused cached conversion of {pdf_file}")
+        return document_key, True
+
+    def write_document(self, data, output_docx, document_key=None, partial=False):
+        """Write concatenated block records to output_docx and cache the file under document_key.
+
+        A partial document, one with pages missing, is counted as such and never cached.
+        """
+        with self.stage("write_docx"):
+            writer = JSONToDocxConverter(output_dir=os.path.dirname(output_docx))
+            writer.convert_data(data, os.path.basename(output_docx))
+        METRICS.inc("documents_total", source="partial" if partial else "ocr")
+        if partial:
+            return
+
+        if document_key is not None:
+            with self.stage("cache"), open(output_docx, "rb") as f:
+                self.cache.put_docx(document_key, f.read())
+
+    def run(self, pdf_file, output_docx, debug_dir=None, progress=None, manifest=None):
+        """Convert pdf_file to output_docx and return the per-stage wall times in seconds.
+
+        Pages travel between stages as NumPy arrays and block records as BlockRecords
+        columns, so only the DOCX is written unless debug_dir asks for intermediates.
+        progress, if given, is called as progress(pages_done, pages_total) after each page.
+        manifest, a RunManifest for debug_dir, checkpoints the run so it can be resumed.
+        Pages that fail are left out of the DOCX and listed in failed_pages; the DOCX of
+        such a partial document is not cached, though its good pages are.
+        """
+        self.timings = {}
+        self.failed_pages = []
+        output_docx = os.path.abspath(output_docx)
+
+        if manifest is not None and manifest.finished_output(output_docx):
+            print(f"{output_docx} was already written by {manifest.run_dir}")
+            return dict(self.timings)
+
+        document_key, reused = self.restore_document(pdf_file, output_docx)
+        if reused:
+            if progress is not None:
+                total_pages = self.converter.page_count(pdf_file)
+                progress(total_pages, total_pages)
+            return dict(self.timings)
+
+        with self.stage("rasterize"):
+            total_pages = self.converter.page_count(pdf_file)
+
+        concatenator = JSONConcatenator()
+        for page_number, records in self.iter_document_records(pdf_file, debug_dir, manifest):
+            if records is not None:
+                with self.stage("concatenate"):
+                    concatenator.add_page(records)
+            if progress is not None:
+                progress(page_number, total_pages)
+        data = concatenator.concatenated()
+
+        if debug_dir:
+            self.save_concatenated(debug_dir, data)
+
+        if self.failed_pages:
+            print(f"Warning: pages {', '.join(map(str, self.failed_pages))} could not be converted; "
+                  f"{output_docx} is missing them and was not cached")
+        self.write_document(data, output_docx, document_key, partial=bool(self.failed_pages))
+        if manifest is not None and not self.failed_pages:
+            # Failed pages are not journaled; leaving the run incomplete makes --resume redo them.
+            manifest.complete(output_docx, total_pages)
+
+        return dict(self.timings)
@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+import uuid
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when no more jobs can be queued."""
+
+
+class Job:
+    """One queued conversion, with status and per-page progress that other threads can wait on."""
+
+    def __init__(self, func, args):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.status = "queued"
+        self.pages_done = 0
+        self.pages_total = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def report_progress(self, pages_done, pages_total):
+        """Engine progress callback: record that pages_done of pages_total pages are finished."""
+        self.update(pages_done=pages_done, pages_total=pages_total)
+
+    def is_finished(self):
+        return self.status in ("done", "error")
+
+    def wait_for_change(self, seen_version, timeout=None):
+        """Block until the job changes after seen_version (or timeout) and return the current version."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != seen_version, timeout=timeout)
+            return self.version
+
+    def to_dict(self):
+        with self.changed:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "pages_done": self.pages_done,
+                "pages_total": self.pages_total,
+                "result": self.result,
+                "error": self.error,
+            }
+
+
+class JobQueue:
+    """Run jobs on a fixed number of threads behind a bounded queue.
+
+    submit raises QueueFull instead of blocking once max_queued jobs are waiting,
+    so callers can turn a full queue into backpressure (HTTP 429). Finished jobs
+    are kept for keep_seconds so clients can still poll for their result.
+    """
+
+    def __init__(self, workers=2, max_queued=8, keep_seconds=3600):
+        self.pending = queue.Queue(maxsize=max_queued)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.keep_seconds = keep_seconds
+        self.threads = [
+            threading.Thread(target=self.work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, func, *args):
+        """Queue func(job, *args); its return value becomes job.result."""
+        self.prune()
+        job = Job(func, args)
+        with self.lock:
+            self.jobs[job.id] = job
+        try:
+            self.pending.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job.id]
+            raise QueueFull("Too many conversions are queued; try again later.")
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status_counts(self):
+        """Number of kept jobs in each status."""
+        counts = {"queued": 0, "running": 0, "done": 0, "error": 0}
+        with self.lock:
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def prune(self):
+        cutoff = time.time() - self.keep_seconds
+        with self.lock:
+            for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished < cutoff]:
+                del self.jobs[job_id]
+
+    def work(self):
+        while True:
+            job = self.pending.get()
+            job.update(status="running")
+            try:
+                result = job.func(job, *job.args)
+                job.update(status="done", result=result, finished=time.time())
+            except Exception as e:
+                # A MemoryError from a worker's memory limit has no message of its own.
+                job.update(status="error", error=str(e) or type(e).__name__, finished=time.time())
+            finally:
+                self.pending.task_done()
@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency buckets, from one line crop's OCR to a whole book's DOCX.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metrics:
+    """Counters and latency histograms for this process, plus an optional trace of every timed span.
+
+    Pool workers hand take_delta() back with each page and the parent merges it in,
+    so the parent's registry covers the work of every process. Safe to share
+    between threads, e.g. the server's job threads.
+    """
+
+    def __init__(self, prefix="pdf2docx"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        # (name, labels) -> [count per bucket, with +Inf last; sum of observed seconds]
+        self.histograms = {}
+        # Chrome trace events while tracing, otherwise None.
+        self.events = None
+
+    @property
+    def tracing(self):
+        return self.events is not None
+
+    def start_trace(self):
+        with self.lock:
+            self.events = []
+
+    def reset(self, trace=False):
+        """Forget everything recorded so far, e.g. what a forked worker inherited from its parent."""
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.events = [] if trace else None
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    @contextmanager
+    def time(self, name, trace_args=None, **labels):
+        """Observe the block's wall time in histogram name and, while tracing, add it to the trace.
+
+        trace_args (e.g. the page number) only go into the trace, to keep label values few.
+        """
+        wall_start = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.observe(name, seconds, **labels)
+            if self.events is not None:
+                event = {
+                    "name": next(iter(labels.values()), name), "cat": name, "ph": "X",
+                    "ts": int(wall_start * 1e6), "dur": int(seconds * 1e6),
+                    "pid": os.getpid(), "tid": threading.get_ident(), "args": {**labels, **(trace_args or {})},
+                }
+                with self.lock:
+                    if self.events is not None:
+                        self.events.append(event)
+
+    def take_delta(self):
+        """Return everything recorded since the last call, in a picklable form, and start afresh."""
+        with self.lock:
+            delta = {"counters": self.counters, "histograms": self.histograms, "events": self.events}
+            self.counters = {}
+            self.histograms = {}
+            if self.events is not None:
+                self.events = []
+        return delta
+
+    def merge(self, delta):
+        """Add a take_delta() from another process to this registry."""
+        with self.lock:
+            for key, amount in delta["counters"].items():
+                self.counters[key] = self.counters.get(key, 0) + amount
+            for key, (counts, total) in delta["histograms"].items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+                histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+                histogram[1] += total
+            if self.events is not None and delta["events"]:
+                self.events.extend(delta["events"])
+
+    def to_prometheus(self, gauges=None):
+        """Everything recorded, plus the given {name: value} gauges, in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(counts), total)) for key, (counts, total) in self.histograms.items())
+
+        declared = set()
+        for (name, labels), value in counters:
+            full_name = f"{self.prefix}_{name}"
+            if full_name not in declared:
+                declared.add(full_name)
+                lines.append(f"# TYPE {full_name} counter")
+            lines.append(f"{full_name}{format_labels(labels)} {value}")
+
+        for (name, labels), (counts, total) in histograms:
+            full_name = f"{self.prefix}_{name}"
+            if full_name not in declared:
+                declared.add(full_name)
+                lines.append(f"# TYPE {full_name} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{full_name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{full_name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{full_name}_count{format_labels(labels)} {cumulative}")
+
+        for name, value in sorted((gauges or {}).items()):
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {full_name} gauge")
+            lines.append(f"{full_name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Counters and histogram totals as plain JSON-ready data."""
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), "count": sum(counts), "sum_seconds": total,
+                           "buckets": dict(zip([str(bound) for bound in BUCKETS] + ["+Inf"], counts))}
+                          for (name, labels), (counts, total) in sorted(self.histograms.items())]
+        return {"counters": counters, "histograms": histograms}
+
+    def write_trace(self, path):
+        """Write the trace in the Chrome trace event format (chrome://tracing, Perfetto) with a metrics summary."""
+        with self.lock:
+            events = sorted(self.events or [], key=lambda event: event["ts"])
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "metrics": self.summary()}, f, ensure_ascii=False)
+        print(f"Trace with {len(events)} spans saved to {path}")
+
+
+# The registry every module records into.
+METRICS = Metrics()
@@ -1,13 +1,43 @@
 import cv2
+import numpy as np
 import pytesseract
 import os
 import sys
+from collections import defaultdict
+
+from page_pool import run_tasks, page_number_key
+from tesseract_api import TesseractAPI
+from metrics import METRICS
+from deadline import time_left
+
+# One row per Tesseract level-4 (line) box; conf is the mean confidence of the line's words, -1 if none.
+LINE_BOX_DTYPE = np.dtype([
+    ("x", np.int32),
+    ("y", np.int32),
+    ("w", np.int32),
+    ("h", np.int32),
+    ("conf", np.float32),
+])
+
+
+def scale_boxes(boxes, factor, padding=0):
+    """LINE_BOX_DTYPE boxes found on one render mapped onto a render factor times larger, grown by padding pixels."""
+    scaled = boxes.copy()
+    scaled["x"] = np.maximum(0, np.round(boxes["x"] * factor) - padding)
+    scaled["y"] = np.maximum(0, np.round(boxes["y"] * factor) - padding)
+    scaled["w"] = np.round(boxes["w"] * factor) + 2 * padding
+    scaled["h"] = np.round(boxes["h"] * factor) + 2 * padding
+    return scaled
 
 class TextLineDetector:
-    def __init__(self, input_image_path, output_image_path, pixel_expansion=0):
+    def __init__(self, input_image_path=None, output_image_path=None, pixel_expansion=0, ocr_backend="pytesseract"):
+        if ocr_backend not in ("pytesseract", "tesserocr"):
+            raise ValueError(f"Unknown OCR backend: {ocr_backend}")
         self.input_image_path = input_image_path
         self.output_image_path = output_image_path
         self.pixel_expansion = pixel_expansion
+        self.api = TesseractAPI() if ocr_backend == "tesserocr" else None
+        self.deadline = None
 
     def blur_image(self, image_path, n_percentage):
         if not (0 <= n_percentage <= 100):
@@ -25,15 +55,31 @@ class TextLineDetector:
         
         return blurred_image
 
-    def detect_and_draw_lines(self):
-        image = cv2.imread(self.input_image_path)
-        if image is None:
-            raise FileNotFoundError(f"Input image not found at {self.input_image_path}")
-        
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT)
+    def detect_lines(self, image, dpi=None):
+        """Return the expanded line boxes of a grayscale or BGR page array as a LINE_BOX_DTYPE array.
+
+        Pass dpi for pages not rendered at 200 dpi, so Tesseract does not have to guess it.
+        """
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        METRICS.inc("tesseract_calls_total", call="detect_lines")
+        with METRICS.time("step_seconds", step="detect_lines"):
+            timeout = time_left(self.deadline)
+            if self.api is not None:
+                data = self.api.image_to_data(gray, dpi, timeout=timeout)
+            elif dpi:
+                data = pytesseract.image_to_data(gray, config=f"--dpi {dpi}", output_type=pytesseract.Output.DICT,
+                                                 timeout=timeout)
+            else:
+                data = pytesseract.image_to_data(gray, output_type=pytesseract.Output.DICT, timeout=timeout)
 
         n_boxes = len(data['text'])
+        word_confs = defaultdict(list)
+        for i in range(n_boxes):
+            if int(data['level'][i]) == 5 and float(data['conf'][i]) >= 0:
+                key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+                word_confs[key].append(float(data['conf'][i]))
+
+        boxes = []
         for i in range(n_boxes):
             if int(data['level'][i]) == 4:
                 x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
@@ -43,14 +89,28 @@ class TextLineDetector:
                 w_expanded = w + 2 * self.pixel_expansion
                 h_expanded = h + 2 * self.pixel_expansion
 
-                cv2.rectangle(
-                    image,
-                    (x_expanded, y_expanded),
-                    (x_expanded + w_expanded, y_expanded + h_expanded),
-                    (0, 255, 0),
-                    1
-                )
+                confs = word_confs.get((data['block_num'][i], data['par_num'][i], data['line_num'][i]))
+                conf = sum(confs) / len(confs) if confs else -1
+                boxes.append((x_expanded, y_expanded, w_expanded, h_expanded, conf))
+
+        return np.array(boxes, dtype=LINE_BOX_DTYPE)
+
+    def draw_boxes(self, image, boxes):
+        """Draw line boxes onto a BGR page array in green, in place, and return it."""
+        for x, y, w, h, _ in boxes:
+            cv2.rectangle(image, (int(x), int(y)), (int(x + w), int(y + h)), (0, 255, 0), 1)
+        return image
 
+    def draw_lines(self, image):
+        """Draw Tesseract line boxes onto a BGR page array in place and return it."""
+        return self.draw_boxes(image, self.detect_lines(image))
+
+    def detect_and_draw_lines(self):
+        image = cv2.imread(self.input_image_path)
+        if image is None:
+            raise FileNotFoundError(f"Input image not found at {self.input_image_path}")
+
+        image = self.draw_lines(image)
         cv2.imwrite(self.output_image_path, image)
 
 def get_next_experiment_number(output_folder):
@@ -66,27 +126,35 @@ def get_next_experiment_number(output_folder):
     ]
     return max(experiment_numbers, default=0) + 1
 
-def process_directory(input_directory, output_directory):
+def process_file(input_image_path, output_image_path):
+    detector = TextLineDetector(input_image_path, output_image_path)
+    detector.detect_and_draw_lines()
+
+def process_directory(input_directory, output_directory, workers=1):
     if not os.path.exists(output_directory):
         os.makedirs(output_directory)
 
-    for filename in os.listdir(input_directory):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            input_image_path = os.path.join(input_directory, filename)
-            output_image_path = os.path.join(output_directory, f"processed_{filename}")
+    filenames = sorted(
+        (f for f in os.listdir(input_directory) if f.lower().endswith(('.png', '.jpg', '.jpeg'))),
+        key=page_number_key
+    )
+    tasks = [
+        (os.path.join(input_directory, filename), os.path.join(output_directory, f"processed_{filename}"))
+        for filename in filenames
+    ]
 
-            detector = TextLineDetector(input_image_path, output_image_path)
-            try:
-                detector.detect_and_draw_lines()
-                print(f"Processed {filename} -> {output_image_path}")
-            except Exception as e:
-                print(f"Failed to process {filename}: {e}")
+    for filename, (_, output_image_path), error in zip(filenames, tasks, run_tasks(process_file, tasks, workers)):
+        if isinstance(error, Exception):
+            print(f"Failed to process {filename}: {error}")
+        else:
+            print(f"Processed {filename} -> {output_image_path}")
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python detect_raws.py <input_directory> <output_directory>")
+    if len(sys.argv) not in (3, 4):
+        print("Usage: python detect_raws.py <input_directory> <output_directory> [workers]")
     else:
         input_directory = sys.argv[1]
         output_directory = sys.argv[2]
+        workers = int(sys.argv[3]) if len(sys.argv) == 4 else 1
 
-        process_directory(input_directory, output_directory)
\ No newline at end of file
+        process_directory(input_directory, output_directory, workers)
\ No newline at end of file
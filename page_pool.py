@@ -0,0 +1,280 @@
+import os
+import re
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+
+from metrics import METRICS
+
+# Per-process state built once by _init_worker and reused for every page the worker handles.
+_state = None
+
+
+def _address_space():
+    """This process's virtual memory size in bytes, from /proc/self/status, or None where there is no /proc."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _limit_memory(memory_limit):
+    """Let this process map at most memory_limit more bytes than it has now.
+
+    A forked worker inherits the parent's whole address space, e.g. the server's
+    NumPy, OpenBLAS and OpenCV mappings, which can come near any fixed RLIMIT_AS on
+    a many-core host; the limit is therefore set on top of what is already mapped.
+    An oversized page then fails with MemoryError in this worker instead of
+    exhausting the host. Tesseract subprocesses inherit the limit.
+    """
+    import resource
+    mapped = _address_space()
+    if mapped is None:
+        # Without /proc, cap the heap instead, which does not count inherited mappings.
+        resource.setrlimit(resource.RLIMIT_DATA, (memory_limit, memory_limit))
+        return
+    limit = mapped + memory_limit
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _init_worker(state_factory, state_kwargs, trace=False, memory_limit=None):
+    global _state
+    # A forked worker starts with a copy of the parent's metrics; only its own work should be sent back.
+    METRICS.reset(trace)
+    if memory_limit and sys.platform != "win32":
+        _limit_memory(memory_limit)
+    # Pages already run in parallel across processes; keep OpenCV from oversubscribing the cores.
+    cv2.setNumThreads(1)
+    if state_factory is not None:
+        _state = state_factory(**state_kwargs)
+
+
+def _ping():
+    return os.getpid()
+
+
+def call_state(method_name, *args):
+    """Call a method on the worker's state object; used as the task function by PagePool.imap_state.
+
+    A dotted method_name, e.g. "converter.page_count", calls a method of one of the state's attributes.
+    """
+    target = _state
+    *path, name = method_name.split(".")
+    for attribute in path:
+        target = getattr(target, attribute)
+    return getattr(target, name)(*args)
+
+
+def call_state_with_metrics(method_name, *args):
+    """call_state, returning (result, METRICS delta) so the parent can merge what the worker recorded."""
+    return call_state(method_name, *args), METRICS.take_delta()
+
+
+class PagePool:
+    """Process pool that runs page tasks in parallel and yields their results in submission order.
+
+    At most max_in_flight tasks are submitted ahead of the consumer, so the input
+    iterable is only drained as fast as results are taken, which bounds peak memory.
+    memory_limit, in bytes, caps how much address space each worker process may add
+    to what it started with.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, state_factory=None, state_kwargs=None, memory_limit=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or 2 * self.workers
+        self.state_factory = state_factory
+        self.state_kwargs = state_kwargs or {}
+        self.memory_limit = memory_limit
+        self.executor = self.start_executor()
+
+    def start_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.state_factory, self.state_kwargs, METRICS.tracing, self.memory_limit),
+        )
+
+    def submit(self, func, *args):
+        return self.executor.submit(func, *args)
+
+    def result(self, future, func, args):
+        return future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def call(self, method_name, *args):
+        """Run call_state(method_name, *args) in a worker and return its result.
+
+        The METRICS the worker recorded on the way (e.g. render and text layer times) are merged into this process.
+        """
+        args = (method_name, *args)
+        result, metrics = self.result(self.submit(call_state_with_metrics, *args), call_state_with_metrics, args)
+        METRICS.merge(metrics)
+        return result
+
+    def imap(self, func, arg_tuples, return_exceptions=False, max_in_flight=None):
+        """Yield func(*args) for each args tuple, in order.
+
+        With return_exceptions, a failing task yields its exception instead of raising,
+        so one bad page does not abort the rest. max_in_flight overrides the pool's own
+        limit for this call, e.g. to keep one document from taking over a shared pool.
+        """
+        max_in_flight = max_in_flight or self.max_in_flight
+        pending = deque()
+
+        def take():
+            future, args = pending.popleft()
+            if not return_exceptions:
+                return self.result(future, func, args)
+            try:
+                return self.result(future, func, args)
+            except Exception as e:
+                return e
+
+        for args in arg_tuples:
+            pending.append((self.submit(func, *args), args))
+            if len(pending) >= max_in_flight:
+                yield take()
+        while pending:
+            yield take()
+
+    def imap_state(self, method_name, arg_tuples, return_exceptions=False, max_in_flight=None):
+        """Like imap, but calls method_name on each worker's state object."""
+        return self.imap(call_state, ((method_name, *args) for args in arg_tuples), return_exceptions, max_in_flight)
+
+
+class WarmPagePool(PagePool):
+    """Long-lived PagePool shared by many conversions, e.g. every request a server handles.
+
+    Workers keep their state (and with tesserocr, their loaded traineddata) between
+    documents. The whole pool is replaced after recycle_after jobs per worker, to
+    bound leaks in long-running Tesseract state, and whenever a worker crashes; a
+    job lost to a crash is resubmitted once on the fresh pool.
+    """
+
+    def __init__(self, workers=None, max_in_flight=None, state_factory=None, state_kwargs=None, recycle_after=200,
+                 memory_limit=None):
+        self.lock = threading.Lock()
+        self.recycle_after = recycle_after
+        self.jobs_since_start = 0
+        self.restarts = 0
+        super().__init__(workers, max_in_flight, state_factory, state_kwargs, memory_limit)
+
+    def restart(self, reason, expected=None):
+        """Swap in a fresh executor; with expected, only if that executor is still the current one."""
+        with self.lock:
+            if expected is not None and self.executor is not expected:
+                return
+            old = self.executor
+            self.executor = self.start_executor()
+            self.jobs_since_start = 0
+            self.restarts += 1
+        print(f"Restarting OCR workers: {reason}")
+        if self.is_broken(old):
+            # Nothing more can finish on a broken pool; make sure none of its workers outlive it.
+            for process in self.worker_processes(old):
+                if process.exitcode is None:
+                    process.terminate()
+            old.shutdown(wait=False, cancel_futures=True)
+            return
+        # Jobs already handed to the old workers still finish; its processes exit afterwards.
+        old.shutdown(wait=False)
+
+    @staticmethod
+    def worker_processes(executor):
+        return list((getattr(executor, "_processes", None) or {}).values())
+
+    @classmethod
+    def is_broken(cls, executor):
+        """True if executor can no longer run tasks: a worker crashed or its process is gone."""
+        if getattr(executor, "_broken", False):
+            return True
+        return any(process.exitcode is not None for process in cls.worker_processes(executor))
+
+    def submit(self, func, *args):
+        with self.lock:
+            recycle = self.recycle_after and self.jobs_since_start >= self.recycle_after * self.workers
+            executor = self.executor
+        if recycle:
+            self.restart(f"recycling after {self.jobs_since_start} jobs", expected=executor)
+
+        with self.lock:
+            self.jobs_since_start += 1
+            executor = self.executor
+        try:
+            future = executor.submit(func, *args)
+        except BrokenProcessPool:
+            self.restart("worker pool is broken", expected=executor)
+            executor = self.executor
+            future = executor.submit(func, *args)
+        future.executor = executor
+        return future
+
+    def result(self, future, func, args):
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self.restart("a worker crashed", expected=future.executor)
+            return self.executor.submit(func, *args).result()
+
+    def warm_up(self):
+        """Start every worker process now so the first request does not pay for it."""
+        for future in [self.executor.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def health_check(self):
+        """Return True if the workers are alive; if the pool is broken, restart it and return False.
+
+        Looks at the executor and its processes instead of sending a task, which on a
+        busy but healthy pool would wait behind the pages already in flight.
+        """
+        executor = self.executor
+        if not self.is_broken(executor):
+            return True
+        self.restart("health check found the worker pool broken", expected=executor)
+        return False
+
+    def status(self):
+        return {
+            "workers": self.workers,
+            "jobs_since_start": self.jobs_since_start,
+            "restarts": self.restarts,
+        }
+
+
+def run_tasks(func, arg_tuples, workers=1, max_in_flight=None):
+    """Yield func(*args), or the exception it raised, for each args tuple in order.
+
+    Runs in this process when workers <= 1 and in a PagePool otherwise.
+    """
+    if workers <= 1:
+        for args in arg_tuples:
+            try:
+                yield func(*args)
+            except Exception as e:
+                yield e
+        return
+
+    with PagePool(workers, max_in_flight) as pool:
+        yield from pool.imap(func, arg_tuples, return_exceptions=True)
+
+
+def page_number_key(filename):
+    """Sort key putting page_N files in page order and anything else last."""
+    match = re.search(r"page_(\d+)", filename)
+    return int(match.group(1)) if match else float('inf')
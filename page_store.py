@@ -0,0 +1,150 @@
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Stores a worker process keeps mapped at once; older ones are unmapped when another is opened.
+MAX_OPEN_STORES = 4
+
+_open_stores = OrderedDict()
+_open_stores_lock = threading.Lock()
+
+
+class PageRef:
+    """Picklable handle to one page in a PageStore, sent to pool workers instead of the page itself."""
+
+    def __init__(self, path, slot, serial):
+        self.path = path
+        self.slot = slot
+        self.serial = serial
+
+    def load(self):
+        """Return the page as a read-only view of this process's mapping of the store."""
+        with _open_stores_lock:
+            store = _open_stores.pop(self.path, None)
+            if store is None:
+                store = PageStore(self.path)
+            _open_stores[self.path] = store
+            while len(_open_stores) > MAX_OPEN_STORES:
+                _open_stores.popitem(last=False)[1].close()
+        return store.get(self.slot, self.serial)
+
+
+class PageStore:
+    """Grayscale uint8 pages in one memory-mapped file, at a fixed stride per slot.
+
+    The file holds a header, an index of each slot's page shape and a serial number,
+    then the slots. Pages are written once by the process that renders them and
+    read by pool workers as zero-copy NumPy views, so no pixels go through pickle or
+    a pipe. The store is a ring of slots that the writer releases once a page's
+    result is back; the serial number catches a reader handed a slot that has been
+    reused since. The OS page cache decides what stays in RAM.
+    """
+
+    MAGIC = b"PAGESTR1"
+    HEADER = 64
+    ALIGN = 4096
+    # Room above the first page's size for later pages that are a little larger.
+    STRIDE_HEADROOM = 1.25
+
+    def __init__(self, path, slots=None, stride=None):
+        """Open the store at path read-only, or with slots and stride, create it there (replacing any file)."""
+        self.path = path
+        self.writable = slots is not None
+        if self.writable:
+            self.slots = slots
+            self.stride = self.align(stride)
+            size = self.data_offset(slots) + slots * self.stride
+            with open(path, "wb") as f:
+                f.write(self.MAGIC + struct.pack("<QQ", slots, self.stride))
+                # Sparse on most filesystems: slots take disk space only once written.
+                f.truncate(size)
+            self.map = np.memmap(path, dtype=np.uint8, mode="r+", shape=(size,))
+        else:
+            self.map = np.memmap(path, dtype=np.uint8, mode="r")
+            header = bytes(self.map[:len(self.MAGIC) + 16])
+            if header[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError(f"{path} is not a page store")
+            self.slots, self.stride = struct.unpack("<QQ", header[len(self.MAGIC):])
+        self.index = self.map[self.HEADER:self.HEADER + self.slots * 24].view(np.int64).reshape(self.slots, 3)
+        self.data = self.map[self.data_offset(self.slots):]
+        self.free = list(range(self.slots - 1, -1, -1)) if self.writable else []
+        self.serial = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def align(cls, size):
+        return -(-int(size) // cls.ALIGN) * cls.ALIGN
+
+    @classmethod
+    def data_offset(cls, slots):
+        return cls.align(cls.HEADER + slots * 24)
+
+    @classmethod
+    def mapped_size(cls, slots, page_size):
+        """Bytes mapped by a store of slots slots that temporary() sizes for pages of page_size pixels."""
+        return cls.data_offset(slots) + slots * cls.align(page_size * cls.STRIDE_HEADROOM)
+
+    @classmethod
+    def temporary(cls, slots, first_page, directory=None):
+        """Create a store in a new temporary file with slots slots, sized for pages like first_page."""
+        fd, path = tempfile.mkstemp(prefix="pages_", suffix=".store", dir=directory)
+        os.close(fd)
+        return cls(path, slots, first_page.size * cls.STRIDE_HEADROOM)
+
+    @staticmethod
+    def storable(page):
+        return isinstance(page, np.ndarray) and page.ndim == 2 and page.dtype == np.uint8
+
+    def add(self, page):
+        """Copy a 2-D uint8 page into a free slot and return its PageRef, or None if it does not fit or no slot is free."""
+        if not self.storable(page) or page.size > self.stride:
+            return None
+        with self.lock:
+            if not self.free:
+                return None
+            slot = self.free.pop()
+            self.serial += 1
+            serial = self.serial
+        height, width = page.shape
+        self.data[slot * self.stride:slot * self.stride + page.size].reshape(height, width)[:] = page
+        self.index[slot] = (height, width, serial)
+        return PageRef(self.path, slot, serial)
+
+    def release(self, ref):
+        """Give a page's slot back once no worker will read it again."""
+        with self.lock:
+            self.index[ref.slot, 2] = 0
+            self.free.append(ref.slot)
+
+    def get(self, slot, serial=None):
+        height, width, stored_serial = (int(value) for value in self.index[slot])
+        if serial is not None and stored_serial != serial:
+            raise ValueError(f"Slot {slot} of {self.path} no longer holds the requested page")
+        return np.asarray(self.data[slot * self.stride:slot * self.stride + height * width]).reshape(height, width)
+
+    def close(self, remove=False):
+        """Unmap the store and, with remove, delete its file; views handed out must no longer be used."""
+        self.index = self.data = None
+        mmap = getattr(self.map, "_mmap", None)
+        self.map = None
+        if mmap is not None:
+            try:
+                mmap.close()
+            except BufferError:
+                # A view is still referenced somewhere; the mapping goes away with it.
+                pass
+        if remove:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(remove=self.writable)
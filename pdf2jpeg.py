@@ -1,12 +1,44 @@
 import sys
 import os
+import re
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+from metrics import METRICS
+from deadline import time_left
 
 class PDFToJPEG:
-    def __init__(self):
+    # Longest side of the downscaled copy used by the cheap orientation check.
+    PREVIEW_SIZE = 600
+    # Row/column profile variation ratio beyond which text lines are clearly horizontal (or vertical).
+    DIRECTION_RATIO = 2.0
+
+    def __init__(self, osd_sample_pages=2, osd_verify_every=25, render_pool=None):
         pytesseract.pytesseract.tesseract_cmd = r'/opt/homebrew/bin/tesseract'
+        self.osd_sample_pages = osd_sample_pages
+        self.osd_verify_every = osd_verify_every
+        # A PagePool whose workers' state is a PipelineEngine, e.g. under a memory limit: poppler then
+        # runs, and its pages are decoded, in those workers instead of in this process.
+        self.render_pool = render_pool
+        self.deadline = None
+        self.reset_orientation()
+
+    def in_render_pool(self, method_name, *args):
+        """Run one of this class's methods on the converter of a render_pool worker; its METRICS come back here."""
+        return self.render_pool.call("converter." + method_name, *args)
+
+    def reset_orientation(self):
+        """Forget the per-document orientation decision; called at the start of every document."""
+        self.document_angle = None
+        self.document_mixed = False
+        self.sampled_angles = []
+        self.pages_since_osd = 0
+        self.orientation_log = []
 
     def ensure_directory_exists(self, directory):
         """Ensure the specified directory exists, creating it if necessary."""
@@ -15,33 +47,243 @@ class PDFToJPEG:
 
     def detect_orientation(self, image):
         """Detect the orientation of an image using Tesseract."""
-        osd = pytesseract.image_to_osd(image)
+        METRICS.inc("tesseract_calls_total", call="osd")
+        with METRICS.time("step_seconds", step="osd"):
+            osd = pytesseract.image_to_osd(image, timeout=time_left(self.deadline))
         angle = int(osd.split('\n')[2].split(':')[1].strip())
         return angle
 
+    def line_direction(self, image):
+        """Classify text lines on a downscaled copy as 'horizontal', 'vertical', 'blank' or 'ambiguous'.
+
+        Horizontal lines make the row ink profile alternate between lines and gaps
+        while the column profile stays flat; rotating by 90 degrees swaps the two.
+        This cannot tell 0 from 180 degrees, which is left to OSD and the document angle.
+        """
+        preview = image.copy()
+        preview.thumbnail((self.PREVIEW_SIZE, self.PREVIEW_SIZE))
+        ink = np.asarray(preview.convert("L")) < 200
+        rows = np.nonzero(ink.any(axis=1))[0]
+        cols = np.nonzero(ink.any(axis=0))[0]
+        if len(rows) < 2 or len(cols) < 2:
+            return "blank"
+
+        ink = ink[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        row_profile = ink.sum(axis=1)
+        col_profile = ink.sum(axis=0)
+        row_variation = row_profile.std() / max(row_profile.mean(), 1e-6)
+        col_variation = col_profile.std() / max(col_profile.mean(), 1e-6)
+        ratio = row_variation / max(col_variation, 1e-6)
+        if ratio >= self.DIRECTION_RATIO:
+            return "horizontal"
+        if ratio <= 1 / self.DIRECTION_RATIO:
+            return "vertical"
+        return "ambiguous"
+
+    def decide_orientation(self, image):
+        """Return the page angle, running Tesseract OSD only when the cheap checks cannot decide.
+
+        Horizontal pages reuse the document angle once the first osd_sample_pages
+        such pages agree on it, with a verifying OSD every osd_verify_every pages.
+        Each decision is appended to orientation_log as (path, angle).
+        """
+        direction = self.line_direction(image)
+        if direction == "blank":
+            self.orientation_log.append(("blank", 0))
+            return 0
+
+        settled = direction == "horizontal" and self.document_angle is not None
+        if settled and self.pages_since_osd < self.osd_verify_every:
+            self.pages_since_osd += 1
+            self.orientation_log.append(("document", self.document_angle))
+            return self.document_angle
+
+        angle = self.detect_orientation(image)
+        self.pages_since_osd = 0
+        self.orientation_log.append(("osd", angle))
+        if direction != "horizontal" or self.document_mixed:
+            return angle
+
+        if settled and angle != self.document_angle:
+            print(f"Orientation: verifying OSD found {angle} degrees, not {self.document_angle}; running OSD on every page")
+            self.document_angle = None
+            self.document_mixed = True
+        elif self.document_angle is None:
+            self.sampled_angles.append(angle)
+            if len(set(self.sampled_angles)) > 1:
+                self.document_mixed = True
+            elif len(self.sampled_angles) >= self.osd_sample_pages:
+                self.document_angle = angle
+        return angle
+
+    def orientation_summary(self):
+        counts = {}
+        for path, _ in self.orientation_log:
+            counts[path] = counts.get(path, 0) + 1
+        skipped = len(self.orientation_log) - counts.get("osd", 0)
+        details = ", ".join(f"{path}: {count}" for path, count in sorted(counts.items()))
+        return f"Orientation: OSD skipped on {skipped} of {len(self.orientation_log)} pages ({details})"
+
     def rotate_image(self, image, angle):
         """Rotate an image by the specified angle."""
         return image.rotate(angle, expand=True)
 
     def process_page(self, image):
         """Process a single page: detect orientation and rotate if necessary."""
-        angle = self.detect_orientation(image)
+        angle = self.decide_orientation(image)
         if angle != 0:
             image = self.rotate_image(image, -angle)
         return image
 
+    def page_count(self, input_pdf):
+        if self.render_pool is not None:
+            return self.in_render_pool("page_count", input_pdf)
+        return pdfinfo_from_path(input_pdf)["Pages"]
+
+    def page_sizes(self, input_pdf, pages):
+        """(width, height) in points of pages 1..pages, from pdfinfo, without rendering anything."""
+        if self.render_pool is not None:
+            return self.in_render_pool("page_sizes", input_pdf, pages)
+        sizes = {}
+        for key, value in pdfinfo_from_path(input_pdf, first_page=1, last_page=pages).items():
+            page = re.fullmatch(r"Page\s+(\d+) size", key)
+            size = page and re.match(r"([\d.]+) x ([\d.]+)", value)
+            if size:
+                sizes[int(page.group(1))] = (float(size.group(1)), float(size.group(2)))
+        return [sizes[page_number] for page_number in sorted(sizes)]
+
+    def render_pages(self, input_pdf, in_memory=False, first_page=None, last_page=None, dpi=200):
+        """Render pages of a PDF (all, or first_page..last_page) as grayscale PIL images at dpi."""
+        with METRICS.time("step_seconds", step="render",
+                          trace_args={"first_page": first_page, "last_page": last_page, "dpi": dpi}):
+            pages = self.convert_pages(input_pdf, in_memory, first_page, last_page, dpi, time_left(self.deadline))
+        METRICS.inc("pixels_rendered_total", sum(page.width * page.height for page in pages))
+        return pages
+
+    def convert_pages(self, input_pdf, in_memory, first_page, last_page, dpi, timeout=None):
+        if self.render_pool is not None:
+            return self.in_render_pool("convert_pages", input_pdf, in_memory, first_page, last_page, dpi, timeout)
+        if in_memory:
+            # pdf2image always routes pdftocairo output through a temp folder, while
+            # pdftoppm streams lossless PGM over its stdout pipe.
+            return convert_from_path(input_pdf, dpi=dpi, fmt='ppm', grayscale=True,
+                                     first_page=first_page, last_page=last_page, timeout=timeout)
+        return convert_from_path(input_pdf, dpi=dpi, fmt='JPEG', grayscale=True, use_pdftocairo=True,
+                                 first_page=first_page, last_page=last_page, timeout=timeout)
+
+    def render_page(self, input_pdf, page_number, dpi, angle=0):
+        """Render one page as a grayscale array at dpi, turned upright by the angle decide_orientation gave it."""
+        image = self.render_pages(input_pdf, True, page_number, page_number, dpi)[0]
+        if angle != 0:
+            image = self.rotate_image(image, -angle)
+        return np.asarray(image)
+
+    def text_layer_pages(self, input_pdf):
+        """Numbers of the pages that carry a text layer, i.e. were typeset rather than scanned.
+
+        Uses poppler's pdftotext, which separates pages with form feeds; returns an
+        empty set if it is not installed.
+        """
+        if self.render_pool is not None:
+            return self.in_render_pool("text_layer_pages", input_pdf)
+        try:
+            output = subprocess.run(["pdftotext", "-q", input_pdf, "-"], capture_output=True, check=True).stdout
+        except (OSError, subprocess.CalledProcessError):
+            return set()
+        pages = output.decode("utf-8", errors="replace").split("\f")
+        return {page_number for page_number, text in enumerate(pages, start=1) if text.strip()}
+
+    def iter_chunks(self, total, chunk_size, skip_pages):
+        """Yield the (first_page, last_page) ranges to render, and (page, None) for each page in skip_pages."""
+        first_page = 1
+        while first_page <= total:
+            if first_page in skip_pages:
+                yield first_page, None
+                first_page += 1
+                continue
+            last_page = first_page
+            while last_page < total and last_page - first_page + 1 < chunk_size and last_page + 1 not in skip_pages:
+                last_page += 1
+            yield first_page, last_page
+            first_page = last_page + 1
+
+    def iter_rendered_pages(self, input_pdf, chunk_size=4, in_memory=False, skip_pages=None, dpi=200,
+                            render_threads=1):
+        """Yield rendered PIL pages, before orientation correction, chunk_size pages per render call.
+
+        Only the current chunk is held in memory, however long the document is, or with
+        render_threads > 1, that many chunks rendering side by side ahead of the reader.
+        Pages in skip_pages are not rendered at all; None is yielded in their place.
+        """
+        chunks = self.iter_chunks(self.page_count(input_pdf), chunk_size, skip_pages or ())
+        if render_threads <= 1:
+            for first_page, last_page in chunks:
+                if last_page is None:
+                    yield None
+                    continue
+                chunk = self.render_pages(input_pdf, in_memory, first_page, last_page, dpi)
+                while chunk:
+                    yield chunk.pop(0)
+            return
+
+        with ThreadPoolExecutor(render_threads) as executor:
+            pending = deque()
+            rendering = 0
+            for first_page, last_page in chunks:
+                if last_page is None:
+                    pending.append(None)
+                    continue
+                pending.append(executor.submit(self.render_pages, input_pdf, in_memory, first_page, last_page, dpi))
+                rendering += 1
+                while rendering >= render_threads:
+                    future = pending.popleft()
+                    if future is None:
+                        yield None
+                        continue
+                    rendering -= 1
+                    chunk = future.result()
+                    while chunk:
+                        yield chunk.pop(0)
+            for future in pending:
+                if future is None:
+                    yield None
+                    continue
+                chunk = future.result()
+                while chunk:
+                    yield chunk.pop(0)
+
+    def iter_pages(self, input_pdf, chunk_size=4, in_memory=False):
+        """Yield orientation-corrected PIL pages as they are rendered."""
+        self.reset_orientation()
+        for image in self.iter_rendered_pages(input_pdf, chunk_size, in_memory):
+            yield self.process_page(image)
+        print(self.orientation_summary())
+
+    def iter_page_arrays(self, input_pdf, chunk_size=4):
+        """Yield orientation-corrected grayscale NumPy pages as they are rendered, without disk I/O."""
+        for image in self.iter_pages(input_pdf, chunk_size, in_memory=True):
+            yield np.asarray(image)
+
+    def convert_pdf_to_images(self, input_pdf):
+        """Render all pages of a PDF and return them as orientation-corrected PIL images."""
+        return list(self.iter_pages(input_pdf))
+
+    def convert_pdf_to_arrays(self, input_pdf):
+        """Render all pages of a PDF as orientation-corrected grayscale NumPy arrays, without disk I/O."""
+        return list(self.iter_page_arrays(input_pdf))
+
     def convert_pdf_to_jpeg(self, input_pdf, output_path):
         """Convert all pages of a PDF to JPEG images, correcting orientation."""
         self.ensure_directory_exists(output_path)
 
         try:
-            images = convert_from_path(input_pdf, dpi=200, fmt='JPEG', grayscale=True, use_pdftocairo=True)
-            for i, image in enumerate(images):
-                processed_image = self.process_page(image)
+            saved = 0
+            for i, processed_image in enumerate(self.iter_pages(input_pdf)):
                 output_file = os.path.join(output_path, f"page_{i + 1}.jpeg")
                 processed_image.save(output_file, "JPEG")
+                saved += 1
 
-            print(f"Successfully saved {len(images)} pages as JPEG images in '{output_path}'")
+            print(f"Successfully saved {saved} pages as JPEG images in '{output_path}'")
         except Exception as e:
             print(f"An error occurred: {e}")
             sys.exit(1)
@@ -1,32 +1,36 @@
 import os
 import shutil
-import subprocess
+import sys
 from pathlib import Path
 from datetime import datetime
 
+from engine import PipelineEngine
+from result_cache import ResultCache
+from checkpoint import RunManifest, find_resumable_run
+from metrics import METRICS
+
 class PDFToDocxPipeline:
     def __init__(self, base_path="./"):
         self.base_path = base_path
         self.exp_folder = None
 
     def get_next_experiment_folder(self):
-        """Get the next experiment folder name like exp_1, exp_2, etc."""
+        """Create and return the next experiment folder, like exp_1, exp_2, etc.
+
+        The folder is claimed by creating it, so concurrent runs in the same base_path
+        never share one.
+        """
+        os.makedirs(self.base_path, exist_ok=True)
         exp_num = 1
         while True:
             exp_folder = os.path.join(self.base_path, f"exp_{exp_num}")
-            if not os.path.exists(exp_folder):
-                os.makedirs(exp_folder)
-                self.exp_folder = exp_folder
-                return exp_folder
-            exp_num += 1
-
-    @staticmethod
-    def run_step(command):
-        """Run a subprocess command."""
-        print(f"Running: {command}")
-        result = subprocess.run(command, shell=True)
-        if result.returncode != 0:
-            raise RuntimeError(f"Command failed: {command}")
+            try:
+                os.mkdir(exp_folder)
+            except FileExistsError:
+                exp_num += 1
+                continue
+            self.exp_folder = exp_folder
+            return exp_folder
 
     @staticmethod
     def clean_folder(folder_path):
@@ -40,65 +44,46 @@ class PDFToDocxPipeline:
         if self.exp_folder and os.path.exists(self.exp_folder):
             shutil.rmtree(self.exp_folder)
 
-    # def run_pipeline(self, pdf_file):
-    #     start = datetime.now()
-    #     # try:
-    #     self.get_next_experiment_folder()
-    #     images_output_path = os.path.join(self.exp_folder, "images")
-    #     os.makedirs(images_output_path, exist_ok=True)
-    #     self.run_step(f"python pdf2jpeg.py {pdf_file} {images_output_path}")
-
-    #     rectangled_images_path = os.path.join(self.exp_folder, "rectangled_images")
-    #     os.makedirs(rectangled_images_path, exist_ok=True)
-    #     self.run_step(f"python new_raws.py {images_output_path} {rectangled_images_path}")
-
-    #     # self.clean_folder(images_output_path)
-
-    #     json_output_path = os.path.join(self.exp_folder, "jsons")
-    #     os.makedirs(json_output_path, exist_ok=True)
-    #     self.run_step(f"python blocked.py {rectangled_images_path} {json_output_path}")
-
-    #     # self.clean_folder(rectangled_images_path)
+    def run_pipeline(self, pdf_file, output_docx, save_intermediates=False, workers=1, ocr_mode="per_crop", pool=None,
+                     progress=None, cache=None, resume=False, trace_file=None, resolution="fixed",
+                     text_layer=True, overlap=True, raster_threads=1, detect_threads=1, ocr_threads=1,
+                     queue_size=2, max_in_flight=None, render_pool=None, deadline=None):
+        """Convert pdf_file to output_docx and return the numbers of the pages that could not be converted.
 
-    #     concatenated_json_path = os.path.join(json_output_path, "concatenated.json")
-    #     self.run_step(f"python conc_jsons.py {json_output_path}")
-
-    #     self.run_step(f"python write_docx.py {concatenated_json_path}")
-    #     # self.clean_folder(json_output_path)
-    #     end = datetime.now()    
-    #     print(f"All steps completed. Outputs saved in: {self.exp_folder}")
-
-    #     td = (end - start).total_seconds()  # No multiplication needed
-    #     print(f"The time of execution of the above program is : {td:.03f}s")
-    #     # finally:
-    #     #     self.clean_experiment_folder()
-
-    def run_pipeline(self, pdf_file, output_docx):
+        With a deadline, a time.time() value, no Tesseract or poppler call runs past it.
+        """
         start = datetime.now()
-        
-        self.get_next_experiment_folder()
-        images_output_path = os.path.join(self.exp_folder, "images")
-        os.makedirs(images_output_path, exist_ok=True)
-        self.run_step(f"python pdf2jpeg.py {pdf_file} {images_output_path}")
-
-        rectangled_images_path = os.path.join(self.exp_folder, "rectangled_images")
-        os.makedirs(rectangled_images_path, exist_ok=True)
-        self.run_step(f"python new_raws.py {images_output_path} {rectangled_images_path}")
-
-        json_output_path = os.path.join(self.exp_folder, "jsons")
-        os.makedirs(json_output_path, exist_ok=True)
-        self.run_step(f"python blocked.py {rectangled_images_path} {json_output_path}")
-
-        concatenated_json_path = os.path.join(json_output_path, "concatenated.json")
-        self.run_step(f"python conc_jsons.py {json_output_path}")
-
-        self.run_step(f"python write_docx.py {concatenated_json_path} {output_docx}")
+        if trace_file:
+            METRICS.start_trace()
+
+        engine = PipelineEngine(workers=workers, ocr_mode=ocr_mode, pool=pool, cache=cache, resolution=resolution,
+                                text_layer=text_layer, overlap=overlap, raster_threads=raster_threads,
+                                detect_threads=detect_threads, ocr_threads=ocr_threads, queue_size=queue_size,
+                                max_in_flight=max_in_flight, render_pool=render_pool, deadline=deadline)
+        if resume:
+            # Pick up the newest exp_N run of this PDF and settings, or start one that a later --resume can use.
+            self.exp_folder = find_resumable_run(self.base_path, pdf_file, engine.settings_digest())
+            if self.exp_folder is None:
+                self.get_next_experiment_folder()
+        elif save_intermediates:
+            self.get_next_experiment_folder()
+        manifest = None
+        if self.exp_folder:
+            manifest = RunManifest.open(self.exp_folder, pdf_file, engine.settings_digest(), resume=resume)
+        engine.run(pdf_file, output_docx, debug_dir=self.exp_folder, progress=progress, manifest=manifest)
 
         end = datetime.now()
-        print(f"All steps completed. Outputs saved in: {self.exp_folder}")
+        if self.exp_folder:
+            print(f"All steps completed. Intermediates saved in: {self.exp_folder}")
+        else:
+            print(f"All steps completed. Output saved to: {output_docx}")
+        engine.report_timings()
 
         td = (end - start).total_seconds()
         print(f"The time of execution of the program is : {td:.03f}s")
+        if trace_file:
+            METRICS.write_trace(trace_file)
+        return engine.failed_pages
 
 
 # if __name__ == "__main__":
@@ -115,8 +100,42 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Automate PDF to DOCX text extraction pipeline.")
     parser.add_argument("pdf_file", help="Path to the input PDF file.")
     parser.add_argument("output_docx", help="Path to save the output DOCX file.")
+    parser.add_argument("--save-intermediates", action="store_true",
+                        help="Also write page images and JSONs to a new exp_N folder for debugging.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes that detect and OCR pages in parallel.")
+    parser.add_argument("--ocr-mode", choices=("per_crop", "batched"), default="per_crop",
+                        help="Run Tesseract once per line crop, or once per page on stacked crops.")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Reuse page and document results cached in this folder across runs.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the latest exp_N run of this PDF, redoing only pages it had not finished.")
+    parser.add_argument("--resolution", choices=("fixed", "adaptive"), default="fixed",
+                        help="Render every page at 200 dpi, or find lines at 100 dpi and OCR at the dpi they need.")
+    parser.add_argument("--no-text-layer", action="store_true",
+                        help="OCR every page, even those with a text layer that could be read directly.")
+    parser.add_argument("--no-overlap", action="store_true",
+                        help="Render, detect and OCR one page at a time instead of overlapping the stages.")
+    parser.add_argument("--raster-threads", type=int, default=1,
+                        help="Threads rendering pages ahead of line detection.")
+    parser.add_argument("--detect-threads", type=int, default=1,
+                        help="Threads detecting text lines when overlapping stages in-process.")
+    parser.add_argument("--ocr-threads", type=int, default=1,
+                        help="Threads OCR'ing line crops when overlapping stages in-process.")
+    parser.add_argument("--queue-size", type=int, default=2,
+                        help="Pages each overlapped stage may queue for the next one.")
+    parser.add_argument("--trace", default=None,
+                        help="Write a JSON trace of every stage, page and OCR call to this file.")
 
     args = parser.parse_args()
 
     pipeline = PDFToDocxPipeline()
-    pipeline.run_pipeline(args.pdf_file, args.output_docx)
+    failed_pages = pipeline.run_pipeline(args.pdf_file, args.output_docx, save_intermediates=args.save_intermediates,
+                          workers=args.workers, ocr_mode=args.ocr_mode,
+                          cache=ResultCache(args.cache_dir) if args.cache_dir else None, resume=args.resume,
+                          trace_file=args.trace, resolution=args.resolution, text_layer=not args.no_text_layer,
+                          overlap=not args.no_overlap, raster_threads=args.raster_threads,
+                          detect_threads=args.detect_threads, ocr_threads=args.ocr_threads,
+                          queue_size=args.queue_size)
+    if failed_pages:
+        sys.exit(1)
@@ -0,0 +1,116 @@
+import struct
+
+import numpy as np
+
+# One row per block record, named after the keys of the JSON records. The text of
+# every row lives in one string; text_end is where each row's text ends in it.
+RECORD_DTYPE = np.dtype([
+    ("order", "<i4"),
+    ("horizontal_length_left", "<i4"),
+    ("horizontal_length_right", "<i4"),
+    ("vertical_length_to_previous", "<i4"),
+    ("vertical_length_to_next", "<i4"),
+    ("area", "<f8"),
+    ("color_code", "u1", (3,)),
+    ("text_end", "<i4"),
+])
+
+# Keys of a JSON record, in the order BlockExtractor has always written them.
+RECORD_KEYS = ("order", "text", "horizontal_length_left", "horizontal_length_right", "vertical_length_to_previous",
+               "vertical_length_to_next", "area", "color_code")
+
+
+class BlockRecords:
+    """The block records of a page, or of a whole document, as columns instead of one dict per line.
+
+    The numeric fields are a structured NumPy array (35 bytes a line) and the texts
+    one string, so a page costs a few allocations however many lines it has, pickles
+    to pool workers as two buffers, and to_bytes/from_bytes store it without JSON.
+    to_dicts gives the JSON records the rest of the tools read and write.
+    """
+
+    __slots__ = ("rows", "text")
+
+    MAGIC = b"BREC1"
+
+    def __init__(self, rows, text):
+        self.rows = rows
+        self.text = text
+
+    @classmethod
+    def from_columns(cls, texts, **columns):
+        """Build records from their texts and one sequence per RECORD_DTYPE field (all but text_end)."""
+        rows = np.zeros(len(texts), dtype=RECORD_DTYPE)
+        if not texts:
+            return cls(rows, "")
+        for name, values in columns.items():
+            rows[name] = values
+        rows["text_end"] = np.cumsum([len(text) for text in texts])
+        return cls(rows, "".join(texts))
+
+    @classmethod
+    def from_dicts(cls, records):
+        """Records loaded from JSON, e.g. a checkpointed page."""
+        columns = {name: [record[name] for record in records] for name in RECORD_DTYPE.names if name != "text_end"}
+        return cls.from_columns([record["text"] for record in records], **columns)
+
+    def to_dicts(self):
+        """The records as the JSON-ready dicts BlockExtractor used to build, for debugging and the file-based tools."""
+        columns = [self.texts() if key == "text" else self.rows[key].tolist() for key in RECORD_KEYS]
+        return [dict(zip(RECORD_KEYS, values)) for values in zip(*columns)]
+
+    def texts(self):
+        ends = self.rows["text_end"].tolist()
+        return [self.text[start:end] for start, end in zip([0] + ends[:-1], ends)]
+
+    def text_lengths(self):
+        return np.diff(self.rows["text_end"], prepend=0)
+
+    def select(self, mask):
+        """The records where the boolean mask is True."""
+        texts = [text for text, keep in zip(self.texts(), mask) if keep]
+        rows = self.rows[mask]
+        rows["text_end"] = np.cumsum([len(text) for text in texts])
+        return BlockRecords(rows, "".join(texts))
+
+    @classmethod
+    def concatenate(cls, pages):
+        """Join pages into one document, numbered on from page to page the way JSONConcatenator does.
+
+        The first line of each page (order 1) gets a vertical_length_to_previous of 10.
+        """
+        if not pages:
+            return cls(np.zeros(0, dtype=RECORD_DTYPE), "")
+        rows = np.concatenate([page.rows for page in pages])
+        offsets = np.cumsum([0] + [len(page.text) for page in pages[:-1]])
+        rows["text_end"] += np.repeat(offsets, [len(page) for page in pages]).astype(np.int32)
+        rows["vertical_length_to_previous"][rows["order"] == 1] = 10
+        rows["order"] = np.arange(1, len(rows) + 1)
+        return cls(rows, "".join(page.text for page in pages))
+
+    def to_bytes(self):
+        text = self.text.encode("utf-8")
+        return self.MAGIC + struct.pack("<II", len(self.rows), len(text)) + self.rows.tobytes() + text
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(cls.MAGIC)] != cls.MAGIC:
+            raise ValueError("Not serialized block records")
+        count, text_size = struct.unpack_from("<II", data, len(cls.MAGIC))
+        start = len(cls.MAGIC) + 8
+        rows = np.frombuffer(data, dtype=RECORD_DTYPE, count=count, offset=start).copy()
+        text_start = start + count * RECORD_DTYPE.itemsize
+        return cls(rows, bytes(data[text_start:text_start + text_size]).decode("utf-8"))
+
+    def __reduce__(self):
+        return BlockRecords.from_bytes, (self.to_bytes(),)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __eq__(self, other):
+        return (isinstance(other, BlockRecords) and self.text == other.text
+                and self.rows.tobytes() == other.rows.tobytes())
+
+    def __repr__(self):
+        return f"BlockRecords({len(self)} lines)"
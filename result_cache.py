@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+from metrics import METRICS
+from records import BlockRecords
+
+
+class ResultCache:
+    """Size-bounded LRU cache on local disk, addressed by content hashes.
+
+    Holds two kinds of entries: the block records of a page (keyed by a hash of the
+    rendered page pixels) and finished DOCX bytes (keyed by a hash of the PDF file).
+    Every key also covers a settings digest, so changing the OCR settings or the
+    text_correction table version simply misses instead of returning stale results.
+    Reads refresh an entry's mtime and writes evict the least recently used entries
+    once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir="cache", max_bytes=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = {"page": 0, "docx": 0}
+        self.misses = {"page": 0, "docx": 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self.entries())
+
+    @staticmethod
+    def settings_digest(settings):
+        """Hash a JSON-serializable dict of everything that affects the OCR output."""
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def document_key(pdf_path, settings_digest):
+        digest = hashlib.sha256(settings_digest.encode("ascii"))
+        with open(pdf_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def page_key(page, settings_digest):
+        """Key for a rendered page given as a NumPy array."""
+        digest = hashlib.sha256(settings_digest.encode("ascii"))
+        digest.update(repr((page.shape, page.dtype.str)).encode("ascii"))
+        digest.update(page.tobytes())
+        return digest.hexdigest()
+
+    def path(self, kind, key):
+        # Pages are stored in BlockRecords' binary format; .json entries of older versions are simply missed.
+        extension = "docx" if kind == "docx" else "rec"
+        return os.path.join(self.cache_dir, kind, key[:2], f"{key}.{extension}")
+
+    def entries(self):
+        """Yield (path, size, mtime) for every cached file."""
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def read(self, kind, key):
+        path = self.path(kind, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses[kind] += 1
+            return None
+        with self.lock:
+            self.hits[kind] += 1
+        return data
+
+    def write(self, kind, key, data):
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename, so concurrent readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        METRICS.inc("bytes_written_total", len(data), kind="cache")
+        try:
+            old_size = os.path.getsize(path)
+        except FileNotFoundError:
+            old_size = 0
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache is back under 90% of max_bytes."""
+        target = self.max_bytes * 0.9
+        for path, size, _ in sorted(self.entries(), key=lambda entry: entry[2]):
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.total_bytes -= size
+
+    def get_page(self, key):
+        data = self.read("page", key)
+        return BlockRecords.from_bytes(data) if data is not None else None
+
+    def put_page(self, key, records):
+        self.write("page", key, records.to_bytes())
+
+    def get_docx(self, key):
+        return self.read("docx", key)
+
+    def put_docx(self, key, docx_bytes):
+        self.write("docx", key, docx_bytes)
+
+    def stats(self):
+        with self.lock:
+            return {"hits": dict(self.hits), "misses": dict(self.misses), "bytes": self.total_bytes}
@@ -1,14 +1,173 @@
-from flask import Flask, request, send_from_directory, jsonify
+from flask import Flask, Response, request, send_from_directory, jsonify
 import os
-import subprocess
+import json
+import time
+import shutil
+import tempfile
+import threading
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 
+from engine import PipelineEngine
+from jobs import JobQueue, QueueFull
+from page_pool import WarmPagePool
+from page_store import PageStore, MAX_OPEN_STORES
+from pipeline import PDFToDocxPipeline
+from result_cache import ResultCache
+from metrics import METRICS
+import tesseract_api
+from pdf2jpeg import PDFToJPEG
+
 app = Flask(__name__)
 UPLOAD_FOLDER = "uploads"
 OUTPUT_FOLDER = "outputs"
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", os.cpu_count() or 1))
+OCR_RECYCLE_AFTER = int(os.environ.get("OCR_RECYCLE_AFTER", 200))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 8))
+CACHE_FOLDER = os.environ.get("CACHE_FOLDER", "cache")
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", 2 * 1024 ** 3))
+OCR_RESOLUTION = os.environ.get("OCR_RESOLUTION", "fixed")
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 100 * 1024 ** 2))
+MAX_PAGES = int(os.environ.get("MAX_PAGES", 500))
+# Largest page, in pixels at the dpi it would be OCR'd at, that is rendered at all. Checked with pdfinfo
+# before rendering, so one huge MediaBox cannot exhaust the server; about A0 at 200 dpi.
+MAX_PAGE_PIXELS = int(os.environ.get("MAX_PAGE_PIXELS", 50 * 1000 ** 2))
+# Wall time a conversion may take. Every Tesseract and poppler call gets what is left of it as a timeout,
+# and it is checked again after every page.
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 1800))
+# Memory each OCR worker process may map beyond what it inherits from the server, not counting the page
+# stores it maps; 0 leaves it unlimited.
+OCR_WORKER_MEMORY = int(os.environ.get("OCR_WORKER_MEMORY", 2 * 1024 ** 3))
+# Memory each render worker may map beyond what it inherits from the server. It runs poppler (pdfinfo,
+# pdftoppm), decodes the rendered pages and reads the text layer for one job at a time; 0 leaves it unlimited.
+RENDER_WORKER_MEMORY = int(os.environ.get("RENDER_WORKER_MEMORY", 2 * 1024 ** 3))
+# How long finished jobs, their DOCX files and leftover uploads are kept.
+KEEP_SECONDS = int(os.environ.get("KEEP_SECONDS", 3600))
+CHUNK_SIZE = 1024 * 1024
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+# This is what actually bounds an upload: werkzeug refuses a larger request body before parsing it,
+# whereas request.files has already spooled the whole body by the time save_upload sees the file.
+# Leave room for the multipart headers around the file itself.
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES + 64 * 1024
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+_render_pool = None
+_render_pool_lock = threading.Lock()
+jobs = JobQueue(workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, keep_seconds=KEEP_SECONDS)
+result_cache = ResultCache(CACHE_FOLDER, CACHE_MAX_BYTES)
+
+
+class UploadRejected(Exception):
+    """An upload that is not converted; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def get_ocr_pool():
+    """Return the server-wide warm OCR pool, creating it on first use.
+
+    Created lazily rather than at import so that spawned worker processes, which
+    re-import this module, do not each start a pool of their own.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            backend = "tesserocr" if tesseract_api.available() else "pytesseract"
+            _ocr_pool = WarmPagePool(OCR_WORKERS, state_factory=PipelineEngine, state_kwargs={"ocr_backend": backend},
+                                     recycle_after=OCR_RECYCLE_AFTER, memory_limit=ocr_worker_address_space())
+        return _ocr_pool
+
+def get_render_pool():
+    """Return the server-wide pool that renders pages and reads PDFs, one worker per job thread.
+
+    Keeps everything that parses an uploaded PDF out of the server process, each
+    worker capped at RENDER_WORKER_MEMORY, so a hostile PDF fails its own job.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = WarmPagePool(JOB_WORKERS, state_factory=PipelineEngine,
+                                        recycle_after=OCR_RECYCLE_AFTER, memory_limit=RENDER_WORKER_MEMORY or None)
+        return _render_pool
+
+def max_render_dpi():
+    return PipelineEngine.OCR_DPIS[-1] if OCR_RESOLUTION == "adaptive" else PipelineEngine.REFERENCE_DPI
+
+def ocr_worker_address_space():
+    """Memory limit of an OCR worker: OCR_WORKER_MEMORY plus the page stores it may keep mapped.
+
+    A job's PageStore has a slot per page it may have in flight, each sized for a
+    page of up to MAX_PAGE_PIXELS; a worker keeps MAX_OPEN_STORES of them mapped.
+    """
+    if not OCR_WORKER_MEMORY:
+        return None
+    return OCR_WORKER_MEMORY + MAX_OPEN_STORES * PageStore.mapped_size(job_share() + 1, MAX_PAGE_PIXELS)
+
+def job_share():
+    """Pages one job may have in the shared OCR pool at once, so concurrent jobs split the workers fairly."""
+    return max(1, 2 * OCR_WORKERS // JOB_WORKERS)
+
+def remove_expired(folder, keep_seconds=KEEP_SECONDS):
+    """Delete the job folders in folder last modified more than keep_seconds ago."""
+    cutoff = time.time() - keep_seconds
+    for entry in os.scandir(folder):
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            continue
+
+def save_upload(file, upload_dir):
+    """Copy an uploaded PDF into upload_dir and check it against MAX_PAGES and MAX_PAGE_PIXELS.
+
+    werkzeug has spooled the whole upload before this runs, so MAX_CONTENT_LENGTH is
+    the real size limit; the size check while copying only backs it up. The PDF is
+    read with pdfinfo in a render worker, and no page is rendered here. Returns the
+    saved path and its page count, or raises UploadRejected.
+    """
+    pdf_path = os.path.join(upload_dir, "input.pdf")
+    size = 0
+    with open(pdf_path, "wb") as out:
+        while True:
+            chunk = file.stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if size == 0 and not chunk.startswith(b"%PDF-"):
+                raise UploadRejected("The uploaded file is not a PDF")
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise UploadRejected(f"The file is larger than the limit of {MAX_UPLOAD_BYTES} bytes", 413)
+            out.write(chunk)
+    if size == 0:
+        raise UploadRejected("The uploaded file is empty")
+    METRICS.inc("bytes_written_total", size, kind="upload")
+
+    converter = PDFToJPEG(render_pool=get_render_pool())
+    try:
+        pages = converter.page_count(pdf_path)
+    except Exception:
+        raise UploadRejected("The uploaded PDF could not be read")
+    if pages > MAX_PAGES:
+        raise UploadRejected(f"The PDF has {pages} pages; the limit is {MAX_PAGES}", 413)
+    try:
+        sizes = converter.page_sizes(pdf_path, pages)
+    except Exception:
+        raise UploadRejected("The uploaded PDF could not be read")
+    dpi = max_render_dpi()
+    for page_number, (width, height) in enumerate(sizes, start=1):
+        if (width / 72 * dpi) * (height / 72 * dpi) > MAX_PAGE_PIXELS:
+            raise UploadRejected(f"Page {page_number} is {width:.0f} x {height:.0f} pt, more than "
+                                 f"{MAX_PAGE_PIXELS} pixels at {dpi} dpi", 413)
+    return pdf_path, pages
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    return jsonify({"status": "error", "message": f"The file is larger than the limit of {MAX_UPLOAD_BYTES} bytes"}), 413
 
 @app.route("/upload", methods=["POST"])
 def upload_file():
@@ -19,21 +178,125 @@ def upload_file():
     if file.filename == "":
         return jsonify({"status": "error", "message": "No file selected"}), 400
 
-    filename = secure_filename(file.filename)
-    pdf_path = os.path.join(UPLOAD_FOLDER, filename)
-    docx_path = os.path.join(OUTPUT_FOLDER, filename.replace(".pdf", ".docx"))
+    # Each upload gets a folder of its own, so uploads with the same name never meet.
+    remove_expired(OUTPUT_FOLDER)
+    upload_dir = tempfile.mkdtemp(prefix="job_", dir=UPLOAD_FOLDER)
+    try:
+        pdf_path, _ = save_upload(file, upload_dir)
+    except UploadRejected as e:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return jsonify({"status": "error", "message": str(e)}), e.status
+    except Exception:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+
+    docx_name = (secure_filename(os.path.splitext(file.filename)[0]) or "document") + ".docx"
+    try:
+        job = jobs.submit(convert, upload_dir, pdf_path, docx_name)
+    except QueueFull as e:
+        METRICS.inc("jobs_rejected_total")
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return jsonify({"status": "error", "message": str(e)}), 429
+
+    return jsonify({
+        "status": "queued",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }), 202
 
-    file.save(pdf_path)
+def convert(job, upload_dir, pdf_path, docx_name):
+    """Convert one upload into outputs/<job id>/, then delete the upload.
 
+    The job fails once it has run for JOB_TIMEOUT seconds. Each Tesseract and poppler
+    call is given the time left as its timeout, so a page stuck in one fails instead of
+    holding a worker past the deadline. A document with pages that failed is still
+    returned, with the job's error naming the missing pages.
+    """
+    deadline = time.time() + JOB_TIMEOUT
+
+    def progress(pages_done, pages_total):
+        job.report_progress(pages_done, pages_total)
+        if time.time() > deadline:
+            raise TimeoutError(f"The conversion took longer than {JOB_TIMEOUT}s")
+
+    output_dir = os.path.join(OUTPUT_FOLDER, job.id)
+    os.makedirs(output_dir, exist_ok=True)
     try:
-        subprocess.run(["python", "pipeline.py", pdf_path, docx_path], check=True)
-        return jsonify({"status": "success", "url": f"/outputs/{os.path.basename(docx_path)}"})
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        failed_pages = PDFToDocxPipeline().run_pipeline(pdf_path, os.path.join(output_dir, docx_name),
+                                                        pool=get_ocr_pool(), render_pool=get_render_pool(),
+                                                        progress=progress, cache=result_cache,
+                                                        resolution=OCR_RESOLUTION, max_in_flight=job_share(),
+                                                        deadline=deadline)
+    except Exception:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+    if failed_pages:
+        job.update(error=f"Pages {', '.join(map(str, failed_pages))} could not be converted "
+                         f"and are missing from the document")
+    return f"/outputs/{job.id}/{docx_name}"
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Stream the job's state as server-sent events until it finishes."""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+
+    def stream():
+        seen = -1
+        while True:
+            version = job.wait_for_change(seen, timeout=15)
+            if version == seen:
+                yield ": keep-alive\n\n"
+                continue
+            seen = version
+            state = job.to_dict()
+            yield f"data: {json.dumps(state)}\n\n"
+            if state["status"] in ("done", "error"):
+                return
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/health")
+def health():
+    pool = get_ocr_pool()
+    healthy = pool.health_check()
+    return jsonify({"status": "ok" if healthy else "restarted", **pool.status(),
+                    "cache": result_cache.stats()}), 200 if healthy else 503
+
+@app.route("/metrics")
+def metrics():
+    """Stage, page and OCR call metrics of every conversion so far, in the Prometheus text format."""
+    gauges = {f"jobs_{status}": count for status, count in jobs.status_counts().items()}
+    if _ocr_pool is not None:
+        status = _ocr_pool.status()
+        gauges.update(ocr_workers=status["workers"], ocr_pool_restarts=status["restarts"],
+                      ocr_jobs_since_start=status["jobs_since_start"])
+    cache = result_cache.stats()
+    gauges["cache_bytes"] = cache["bytes"]
+    for kind in cache["hits"]:
+        gauges[f"cache_{kind}_hits"] = cache["hits"][kind]
+        gauges[f"cache_{kind}_misses"] = cache["misses"].get(kind, 0)
+    return Response(METRICS.to_prometheus(gauges), mimetype="text/plain; version=0.0.4")
 
-@app.route("/outputs/<filename>")
-def download_file(filename):
-    return send_from_directory(OUTPUT_FOLDER, filename)
+@app.route("/outputs/<job_id>/<filename>")
+def download_file(job_id, filename):
+    return send_from_directory(os.path.abspath(OUTPUT_FOLDER), f"{secure_filename(job_id)}/{filename}")
 
 if __name__ == "__main__":
+    # Uploads are deleted when their job ends; these are left over from a server that was killed.
+    remove_expired(UPLOAD_FOLDER)
+    get_ocr_pool().warm_up()
+    get_render_pool().warm_up()
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,139 @@
+import queue
+import threading
+
+# Marks the end of the items on a queue.
+END = object()
+
+
+class SourceError:
+    """Carries an exception raised by the input iterable to the consumer, which re-raises it."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Stage:
+    """One step of a StagePipeline: func applied to every item, on `workers` threads at once."""
+
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+class StagePipeline:
+    """Run items through a chain of stages concurrently, each stage on its own threads.
+
+    A feeder thread pulls from the input iterable (e.g. a lazy renderer) while the
+    stages work on earlier items, so page N is rendered while page N-1 is in the
+    first stage and page N-2 in the second. Stages are joined by queues of
+    queue_size items, and at most max_in_flight items are between the input and the
+    consumer, so a slow stage or a slow consumer holds everything before it back.
+    Results come out in input order. The work is meant to release the GIL: Tesseract
+    and poppler run as subprocesses, and OpenCV and NumPy release it themselves.
+    """
+
+    def __init__(self, stages, queue_size=2, max_in_flight=None):
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight or queue_size * (len(self.stages) + 1) + sum(
+            stage.workers for stage in self.stages)
+
+    @staticmethod
+    def put(q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def get(q, stop):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return END
+
+    def feed(self, items, outbox, slots, stop):
+        try:
+            for index, item in enumerate(items):
+                while not slots.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if not self.put(outbox, (index, item), stop):
+                    return
+        except BaseException as e:
+            self.put(outbox, SourceError(e), stop)
+        self.put(outbox, END, stop)
+
+    def work(self, stage, inbox, outbox, remaining, lock, stop):
+        while True:
+            message = self.get(inbox, stop)
+            if message is END:
+                if stop.is_set():
+                    return
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                # The last worker of a stage to finish passes END on; the others hand it to their siblings.
+                self.put(outbox if last else inbox, END, stop)
+                return
+            if isinstance(message, SourceError):
+                self.put(outbox, message, stop)
+                continue
+            index, value = message
+            if not isinstance(value, BaseException):
+                try:
+                    value = stage.func(value)
+                except BaseException as e:
+                    # Passed on rather than raised here, where it would only end this thread.
+                    value = e
+            if not self.put(outbox, (index, value), stop):
+                return
+
+    def run(self, items, return_exceptions=False):
+        """Yield every item of items, passed through each stage's func in turn, in input order.
+
+        With return_exceptions, an item whose stage raised yields that exception instead
+        of stopping the run. An exception from items itself is always raised.
+        """
+        stop = threading.Event()
+        slots = threading.Semaphore(self.max_in_flight)
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self.feed, args=(items, queues[0], slots, stop), name="stage-feed",
+                                    daemon=True)]
+        for stage, inbox, outbox in zip(self.stages, queues, queues[1:]):
+            remaining, lock = [stage.workers], threading.Lock()
+            threads.extend(
+                threading.Thread(target=self.work, args=(stage, inbox, outbox, remaining, lock, stop),
+                                 name=f"stage-{stage.name}-{i}", daemon=True)
+                for i in range(stage.workers)
+            )
+        for thread in threads:
+            thread.start()
+
+        try:
+            finished = {}
+            next_index = 0
+            while True:
+                message = self.get(queues[-1], stop)
+                if message is END:
+                    break
+                if isinstance(message, SourceError):
+                    raise message.error
+                index, value = message
+                finished[index] = value
+                while next_index in finished:
+                    value = finished.pop(next_index)
+                    next_index += 1
+                    slots.release()
+                    if isinstance(value, BaseException) and not (return_exceptions and isinstance(value, Exception)):
+                        raise value
+                    yield value
+        finally:
+            # Also reached when the consumer stops early; the threads notice within a poll interval.
+            stop.set()
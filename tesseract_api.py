@@ -0,0 +1,83 @@
+import numpy as np
+from PIL import Image
+
+try:
+    import tesserocr
+    from tesserocr import PyTessBaseAPI, RIL
+except ImportError:
+    tesserocr = None
+
+DATA_KEYS = ("level", "block_num", "par_num", "line_num", "word_num",
+             "left", "top", "width", "height", "conf", "text")
+
+
+def available():
+    """True when tesserocr is installed and a persistent TesseractAPI can be created."""
+    return tesserocr is not None
+
+
+class TesseractAPI:
+    """Persistent Tesseract engine that keeps its traineddata loaded between calls.
+
+    Mirrors the two pytesseract calls the pipeline makes, image_to_string and
+    image_to_data with Output.DICT, timeout included, so callers can switch backends freely.
+    Not thread-safe: create one per process.
+    """
+
+    def __init__(self, lang=None, psm=3):
+        if tesserocr is None:
+            raise ImportError("tesserocr is not installed; use the pytesseract backend instead.")
+        self.api = PyTessBaseAPI(lang=lang or "eng", psm=psm)
+
+    def set_image(self, image):
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        self.api.SetImage(image)
+
+    def recognize(self, timeout=None):
+        """Recognize the current image, raising RuntimeError like pytesseract if it takes over timeout seconds."""
+        if not self.api.Recognize(int(timeout * 1000) if timeout else 0):
+            raise RuntimeError("Tesseract recognition failed or timed out")
+
+    def image_to_string(self, image, timeout=None):
+        self.set_image(image)
+        if timeout:
+            self.recognize(timeout)
+        return self.api.GetUTF8Text()
+
+    def image_to_data(self, image, dpi=None, timeout=None):
+        """Return line (level 4) and word (level 5) boxes in pytesseract's Output.DICT layout."""
+        self.set_image(image)
+        if dpi:
+            self.api.SetSourceResolution(dpi)
+        self.recognize(timeout)
+
+        data = {key: [] for key in DATA_KEYS}
+        for level, ril in ((4, RIL.TEXTLINE), (5, RIL.WORD)):
+            block_num = par_num = line_num = word_num = 0
+            for item in tesserocr.iterate_level(self.api.GetIterator(), ril):
+                if item.IsAtBeginningOf(RIL.BLOCK):
+                    block_num += 1
+                    par_num = 0
+                if item.IsAtBeginningOf(RIL.PARA):
+                    par_num += 1
+                    line_num = 0
+                if item.IsAtBeginningOf(RIL.TEXTLINE):
+                    line_num += 1
+                    word_num = 0
+                box = item.BoundingBox(ril)
+                if box is None:
+                    continue
+                x1, y1, x2, y2 = box
+                if level == 5:
+                    word_num += 1
+                    conf, text = item.Confidence(ril), item.GetUTF8Text(ril) or ""
+                else:
+                    conf, text = -1, ""
+                for key, value in zip(DATA_KEYS, (level, block_num, par_num, line_num, word_num if level == 5 else 0,
+                                                  x1, y1, x2 - x1, y2 - y1, conf, text)):
+                    data[key].append(value)
+        return data
+
+    def close(self):
+        self.api.End()
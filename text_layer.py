@@ -0,0 +1,107 @@
+try:
+    import pymupdf
+except ImportError:
+    try:
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+from metrics import METRICS
+
+
+def available():
+    """True when PyMuPDF is installed, so text layers can be read instead of OCR'd."""
+    return pymupdf is not None
+
+
+class TextLayerReader:
+    """Read block records straight from the text layer of pages that were typeset rather than scanned.
+
+    Each text line becomes the record BlockExtractor would build from its OCR'd line
+    box, measured in pixels at 200 dpi, so JSONToDocxConverter lays the page out the
+    same way. Bold comes from the font flags and is passed on as a dark color_code.
+    Pages with little or unreadable text, or whose text is invisible (an OCR layer
+    over a scan), return None and are OCR'd as usual.
+    """
+
+    DPI = 200
+    # Fewer visible characters than this and the page is treated as a scan.
+    MIN_CHARS = 20
+    # Share of U+FFFD characters (fonts without a usable ToUnicode map) beyond which the text is unreadable.
+    MAX_UNREADABLE = 0.1
+    # write_docx treats a line as bold when max(color_code) < 200.
+    BOLD_COLOR = [100, 100, 100]
+    REGULAR_COLOR = [230, 230, 230]
+    BOLD_FLAG = 16
+    INVISIBLE_TEXT = 3
+
+    def __init__(self, extractor):
+        if pymupdf is None:
+            raise ImportError("PyMuPDF is not installed; pages can only be OCR'd.")
+        # The BlockExtractor whose record building and space cleanup the text lines go through.
+        self.extractor = extractor
+
+    def read_document(self, pdf_file, skip_pages=()):
+        """Return {page_number: records} for every page not in skip_pages that has a usable text layer."""
+        pages = {}
+        try:
+            with pymupdf.open(pdf_file) as document:
+                for page_number, page in enumerate(document, start=1):
+                    if page_number in skip_pages:
+                        continue
+                    with METRICS.time("step_seconds", step="text_layer", trace_args={"page": page_number}):
+                        records = self.read_page(page)
+                    if records is not None:
+                        pages[page_number] = records
+        except Exception as e:
+            print(f"Could not read the text layer of {pdf_file}, OCR'ing every page: {e}")
+            return {}
+        return pages
+
+    def has_visible_text(self, page):
+        visible = invisible = 0
+        for span in page.get_texttrace():
+            if span["type"] == self.INVISIBLE_TEXT:
+                invisible += len(span["chars"])
+            else:
+                visible += len(span["chars"])
+        return visible >= self.MIN_CHARS and visible > invisible
+
+    def read_lines(self, page):
+        """Return (x, y, w, h, text, bold) for every horizontal text line, in pixels of the upright page."""
+        matrix = page.rotation_matrix * pymupdf.Matrix(self.DPI / 72, self.DPI / 72)
+        lines = []
+        for block in page.get_text("dict")["blocks"]:
+            if block["type"] != 0:
+                continue
+            for line in block["lines"]:
+                dx, dy = line["dir"]
+                # Direction on the upright page; the rotation matrix has no scaling.
+                if abs(dx * matrix.b + dy * matrix.d) > 0.1 * abs(dx * matrix.a + dy * matrix.c):
+                    continue
+                text = "".join(span["text"] for span in line["spans"])
+                if not text.strip():
+                    continue
+                bold_chars = sum(len(span["text"]) for span in line["spans"]
+                                 if span["flags"] & self.BOLD_FLAG or "bold" in span["font"].lower())
+                rect = pymupdf.Rect(line["bbox"]) * matrix
+                x, y = int(round(rect.x0)), int(round(rect.y0))
+                lines.append((x, y, int(round(rect.x1)) - x, int(round(rect.y1)) - y, text, 2 * bold_chars > len(text)))
+        lines.sort(key=lambda line: (line[1], line[0]))
+        return lines
+
+    def read_page(self, page):
+        """Block records of one PyMuPDF page, or None if it has to be OCR'd."""
+        if not self.has_visible_text(page):
+            return None
+        lines = self.read_lines(page)
+        characters = sum(len(line[4]) for line in lines)
+        if characters < self.MIN_CHARS or sum(line[4].count("�") for line in lines) > self.MAX_UNREADABLE * characters:
+            return None
+
+        size = page.rect * pymupdf.Matrix(self.DPI / 72, self.DPI / 72)
+        rectangles = [(x, y, w, h, float(w * h)) for x, y, w, h, _, _ in lines]
+        # The text is exact, so only the whitespace cleanup applies, not the OCR corrections.
+        texts = [self.extractor.process_string(text.strip()) for _, _, _, _, text, _ in lines]
+        colors = [list(self.BOLD_COLOR if bold else self.REGULAR_COLOR) for *_, bold in lines]
+        return self.extractor.build_records(rectangles, texts, colors, int(round(size.width)), int(round(size.height)))
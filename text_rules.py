@@ -0,0 +1,95 @@
+import os
+import re
+import json
+from functools import lru_cache
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules", "rus_legal.json")
+
+
+def interacts(a, b):
+    """True if an occurrence of a can overlap, contain or touch an occurrence of b in some text."""
+    if not a or not b:
+        return True
+    if a in b or b in a:
+        return True
+    for k in range(1, min(len(a), len(b))):
+        if a.endswith(b[:k]) or b.endswith(a[:k]):
+            return True
+    return False
+
+
+class CorrectionRules:
+    """OCR text corrections loaded from a rules file and compiled once.
+
+    The file lists literal replacements and regex patterns; applying them gives
+    exactly what running each replacement with str.replace and then each pattern
+    with re.sub, in file order, would give. Consecutive replacements that cannot
+    interact (no overlap between their patterns, and no earlier output that could
+    form or touch a later pattern) are merged into a single alternation regex with
+    a lookup table, so a line is scanned once per group instead of once per rule,
+    and one scan for any of the literals skips every group on lines with no match.
+    A pattern may name literal text it "requires" to skip lines that cannot match.
+    """
+
+    def __init__(self, rules):
+        self.name = rules.get("name", "rules")
+        self.version = rules["version"]
+        self.replacements = [(rule["old"], rule["new"]) for rule in rules.get("replacements", [])]
+        self.patterns = [
+            (re.compile(rule["pattern"]), rule["replace"], rule.get("lower", False), rule.get("requires", ""))
+            for rule in rules.get("patterns", [])
+        ]
+        self.stages = [self.compile_stage(group) for group in self.group_replacements(self.replacements)]
+        self.any_literal = re.compile("|".join(re.escape(old) for old, _ in self.replacements)) if self.replacements else None
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @property
+    def key(self):
+        """Identifies the rule set in cache keys, e.g. "rus_legal:1"."""
+        return f"{self.name}:{self.version}"
+
+    @staticmethod
+    def group_replacements(replacements):
+        """Split replacements, in order, into groups whose rules can run in one pass."""
+        groups = []
+        for old, new in replacements:
+            group = groups[-1] if groups else None
+            if group is None or any(interacts(old, o) or interacts(old, n) for o, n in group):
+                groups.append([(old, new)])
+            else:
+                group.append((old, new))
+        return groups
+
+    @staticmethod
+    def compile_stage(group):
+        if len(group) == 1:
+            old, new = group[0]
+            return lambda text: text.replace(old, new)
+        table = dict(group)
+        # Longest first, although rules in one group never overlap anyway.
+        pattern = re.compile("|".join(re.escape(old) for old in sorted(table, key=len, reverse=True)))
+        lookup = table.__getitem__
+        return lambda text: pattern.sub(lambda match: lookup(match.group(0)), text)
+
+    def apply(self, text):
+        if self.any_literal is not None and self.any_literal.search(text):
+            for stage in self.stages:
+                text = stage(text)
+        for pattern, replace, lower, requires in self.patterns:
+            if requires not in text:
+                continue
+            if lower:
+                text = pattern.sub(lambda match: match.expand(replace).lower(), text)
+            else:
+                text = pattern.sub(replace, text)
+        return text
+
+
+@lru_cache(maxsize=None)
+def load_rules(path=DEFAULT_RULES):
+    """Return the compiled CorrectionRules for path, built once per process."""
+    return CorrectionRules.from_file(path)
@@ -1,17 +1,27 @@
 import os
 import sys
 import json
+import numpy as np
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
 from collections import defaultdict
 
+from docx_stream import StreamingDocxWriter
+from metrics import METRICS
+from records import BlockRecords
+
+LAYOUT_COLUMNS = ('horizontal_length_left', 'horizontal_length_right', 'vertical_length_to_previous')
+
 class JSONToDocxConverter:
-    def __init__(self, json_path, output_dir="output_docx", font_name="Times New Roman", font_size=14):
+    def __init__(self, json_path=None, output_dir="output_docx", font_name="Times New Roman", font_size=14,
+                 streaming=True):
         self.json_path = json_path
         self.output_dir = output_dir
         self.font_name = font_name
         self.font_size = font_size
+        # Stream document.xml into the zip instead of building a python-docx Document in memory.
+        self.streaming = streaming
 
         os.makedirs(self.output_dir, exist_ok=True)
 
@@ -92,7 +102,64 @@ class JSONToDocxConverter:
 
     #     return transformed_data
 
-    def process_json(self, data):
+    def find_intervals(self, numbers):
+        """Cluster an int array like find_stats, as [((low, high), count), ...] with the most common first."""
+        values = np.sort(numbers)
+        intervals = []
+        start = 0
+        while start < len(values):
+            # Same greedy grouping: everything within 20 of the group's first value.
+            end = int(np.searchsorted(values, values[start] + 20, side="right"))
+            low, high = int(values[start]), int(values[end - 1])
+            # find_stats cannot parse the "low-high" key of a group starting below zero and drops it.
+            if low >= 0:
+                intervals.append(((low, high), end - start))
+            start = end
+        intervals.sort(key=lambda interval: -interval[1])
+        return intervals
+
+    def classify_paragraphs(self, data):
+        """Paragraph labels for data[1:] in one vectorized pass, the same as classify_paragraphs_slow gives.
+
+        Returns None when the layout columns are not all plain ints or there are too
+        few clusters, so the caller can fall back to the original code.
+        """
+        if len(data) < 2 or any(type(entry[column]) is not int for entry in data for column in LAYOUT_COLUMNS):
+            return None
+        left, right, vertical = (np.array([entry[column] for entry in data], dtype=np.int64) for column in LAYOUT_COLUMNS)
+        layout = self.layout_intervals(left, vertical)
+        if layout is None:
+            return None
+        # The first entry always becomes 'cs'; it only counts towards the clusters.
+        return self.label_paragraphs(layout, left[1:], right[1:], vertical[1:])
+
+    def layout_intervals(self, left, vertical):
+        """The two commonest left-indent intervals and the vertical gap limit of a whole document, or None."""
+        left_intervals = self.find_intervals(left)
+        vertical_intervals = self.find_intervals(vertical)
+        if len(left_intervals) < 2 or not vertical_intervals:
+            return None
+        return left_intervals[0][0], left_intervals[1][0], vertical_intervals[0][0][1]
+
+    def label_paragraphs(self, layout, left, right, vertical):
+        """Label entries given as int arrays, using the layout_intervals of the document they belong to."""
+        (first_low, first_high), (second_low, second_high), vertical_limit = layout
+        in_first = (left >= first_low) & (left <= first_high)
+        in_second = (left >= second_low) & (left <= second_high)
+        close = vertical <= vertical_limit
+        outside = ~in_first & ~in_second
+        offset = left - right
+        centered = outside & (np.abs(offset) < 10)
+        right_aligned = outside & (offset > 10)
+        labels = np.select(
+            [in_first & close, in_first, in_second & close, centered & close, centered, right_aligned & close, right_aligned],
+            ['lc', 'ls', 'ls', 'cc', 'cs', 'rc', 'rs'],
+            default='ls',
+        )
+        return labels.tolist()
+
+    def classify_paragraphs_slow(self, data):
+        """The original entry-by-entry classification, for data classify_paragraphs does not handle."""
         # First step: Write numbers to lists
         left_length = [entry['horizontal_length_left'] for entry in data]
         right_length = [entry['horizontal_length_right'] for entry in data]
@@ -129,18 +196,35 @@ class JSONToDocxConverter:
             else:
                 entry['paragraph'] = 'ls'
 
-        for entry in data:
-            if max(entry["color_code"]) < 200:
-                entry['font_type'] = 'bold'
+    def process_json(self, data):
+        with METRICS.time("step_seconds", step="layout"):
+            labels = self.classify_paragraphs(data)
+            if labels is None:
+                self.classify_paragraphs_slow(data)
             else:
-                entry['font_type'] = 'normal'
+                data[0]['paragraph'] = 'cs'
+                for entry, label in zip(data[1:], labels):
+                    entry['paragraph'] = label
 
-        keys_to_keep = {'text', 'order', 'paragraph', 'font_type'}
-        filtered_json = [{key: d[key] for key in keys_to_keep if key in d} for d in data]
+        filtered_json = [self.summarize_entry(entry) for entry in data]
         return self.process_text(filtered_json)
 
+    def summarize_entry(self, entry):
+        """Set an entry's font_type and keep only the keys write_docx needs."""
+        if max(entry["color_code"]) < 200:
+            entry['font_type'] = 'bold'
+        else:
+            entry['font_type'] = 'normal'
+
+        keys_to_keep = {'text', 'order', 'paragraph', 'font_type'}
+        return {key: entry[key] for key in keys_to_keep if key in entry}
+
     def process_text(self, data):
-        result = []
+        return list(self.iter_merged_paragraphs(data))
+
+    def iter_merged_paragraphs(self, data):
+        """Join continuation lines onto the paragraph they continue and yield the paragraphs renumbered."""
+        order = 0
         previous = None
 
         for current in data:
@@ -160,7 +244,9 @@ class JSONToDocxConverter:
                     previous['text'] += ' ' + current['text']
                 else:
                     # If no matching condition, push the previous element to the result
-                    result.append(previous)
+                    order += 1
+                    previous['order'] = order
+                    yield previous
                     previous = current
             else:
                 # For the first item, just set it as the previous item
@@ -168,15 +254,21 @@ class JSONToDocxConverter:
 
         # Add the last remaining item
         if previous:
-            result.append(previous)
-
-        # Rewriting the 'order' correctly
-        for idx, item in enumerate(result):
-            item['order'] = idx + 1
-
-        return result
+            previous['order'] = order + 1
+            yield previous
 
     def write_docx(self, data, output_filename="output.docx"):
+        output_path = os.path.join(self.output_dir, output_filename)
+        with METRICS.time("step_seconds", step="docx_write"):
+            if self.streaming:
+                StreamingDocxWriter(self.font_name, self.font_size).write(data, output_path)
+                print(f"Document saved to {output_path}")
+            else:
+                self.write_docx_document(data, output_filename)
+        METRICS.inc("bytes_written_total", os.path.getsize(output_path), kind="docx")
+
+    def write_docx_document(self, data, output_filename="output.docx"):
+        """Build the document with python-docx; slower and holds it all in memory, kept for comparison."""
         document = Document()
 
         for entry in data:
@@ -208,8 +300,107 @@ class JSONToDocxConverter:
     #     processed_data = self.process_json(filtered_data)
     #     self.write_docx(processed_data)
 
+    def iter_ndjson(self):
+        """Yield the block records of a newline-delimited JSON file one at a time."""
+        if not os.path.exists(self.json_path):
+            raise FileNotFoundError(f"JSON file {self.json_path} not found.")
+
+        with open(self.json_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
     def convert(self, output_filename):
+        if self.json_path.endswith(".ndjson"):
+            self.convert_records(self.iter_ndjson, output_filename)
+            return
         data = self.load_json()
+        self.convert_data(data, output_filename)
+
+    def convert_records(self, open_records, output_filename, chunk_size=4096):
+        """Lay out block records streamed in order from open_records(), which is called twice.
+
+        The first pass only keeps the three layout columns, which the clusters need for
+        the whole document; the second labels entries a chunk at a time and streams them
+        into the document. Data the vectorized classifier cannot handle is loaded and
+        converted the original way.
+        """
+        columns = ([], [], [])
+        for entry in open_records():
+            if len(entry['text']) > 1:
+                for values, column in zip(columns, LAYOUT_COLUMNS):
+                    values.append(entry[column])
+
+        layout = None
+        if len(columns[0]) >= 2 and all(type(value) is int for values in columns for value in values):
+            left, _, vertical = (np.array(values, dtype=np.int64) for values in columns)
+            layout = self.layout_intervals(left, vertical)
+        del columns
+        if layout is None:
+            self.convert_data(list(open_records()), output_filename)
+            return
+
+        entries = self.iter_labeled_entries(open_records(), layout, chunk_size)
+        self.write_docx(self.iter_merged_paragraphs(entries), output_filename)
+
+    def iter_labeled_entries(self, records, layout, chunk_size):
+        """Yield filtered, labelled and summarized entries, labelling chunk_size entries at a time."""
+        chunk = []
+        first = True
+        for entry in records:
+            if len(entry['text']) <= 1:
+                continue
+            if first:
+                entry['paragraph'] = 'cs'
+                first = False
+                yield self.summarize_entry(entry)
+                continue
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                yield from self.label_chunk(chunk, layout)
+                chunk = []
+        yield from self.label_chunk(chunk, layout)
+
+    def label_chunk(self, chunk, layout):
+        if not chunk:
+            return
+        with METRICS.time("step_seconds", step="layout"):
+            left, right, vertical = (np.array([entry[column] for entry in chunk], dtype=np.int64)
+                                     for column in LAYOUT_COLUMNS)
+            labels = self.label_paragraphs(layout, left, right, vertical)
+        for entry, label in zip(chunk, labels):
+            entry['paragraph'] = label
+            yield self.summarize_entry(entry)
+
+    def convert_table(self, records, output_filename):
+        """Lay out BlockRecords straight from their columns; only the merged paragraphs become dicts.
+
+        Gives the same document as convert_data on records.to_dicts(), which handles
+        what the vectorized classifier cannot.
+        """
+        records = records.select(records.text_lengths() > 1)
+        layout = None
+        if len(records) >= 2:
+            left, right, vertical = (records.rows[column].astype(np.int64) for column in LAYOUT_COLUMNS)
+            with METRICS.time("step_seconds", step="layout"):
+                layout = self.layout_intervals(left, vertical)
+                labels = ['cs'] + self.label_paragraphs(layout, left[1:], right[1:], vertical[1:]) if layout else None
+        if layout is None:
+            self.convert_data(records.to_dicts(), output_filename)
+            return
+
+        bold = (records.rows["color_code"].max(axis=1) < 200).tolist()
+        entries = (
+            {'text': text, 'order': order, 'paragraph': label, 'font_type': 'bold' if is_bold else 'normal'}
+            for order, (text, label, is_bold) in enumerate(zip(records.texts(), labels, bold), start=1)
+        )
+        self.write_docx(self.iter_merged_paragraphs(entries), output_filename)
+
+    def convert_data(self, data, output_filename):
+        """Lay out already loaded block records (BlockRecords or dicts) and write them to a DOCX file."""
+        if isinstance(data, BlockRecords):
+            self.convert_table(data, output_filename)
+            return
         filtered_data = self.filter_by_text(data)
         processed_data = self.process_json(filtered_data)
         self.write_docx(processed_data, output_filename)
@@ -230,7 +421,7 @@ class JSONToDocxConverter:
     @staticmethod
     def run_from_command_line():
         if len(sys.argv) != 3:
-            print("Usage: python write_docx.py <json_file_path> <output_docx_path>")
+            print("Usage: python write_docx.py <json_or_ndjson_file_path> <output_docx_path>")
             sys.exit(1)
 
         json_file_path = sys.argv[1]